@@ -0,0 +1,135 @@
+"""Measures how long download threads spend inside logging calls.
+
+Compares the old setup, where every thread formats and writes through a shared
+FileHandler, with the queue pipeline used by main.setup_logging, with and without
+the rate limit on repeated debug messages. The last column counts the records that
+reached the log file.
+
+Usage: python -m benchmarks.logging_benchmark --threads 200 --messages 500
+"""
+
+import os
+import time
+import queue
+import argparse
+import logging
+import tempfile
+import threading
+from logging.handlers import QueueListener
+from downloader.log_utils import DeferredQueueHandler, RateLimitFilter
+
+FORMAT = "%(asctime)s [%(threadName)s] %(levelname)s: %(message)s"
+RETRIES = 3
+
+
+def run_threads(logger, threads, messages, lazy):
+    barrier = threading.Barrier(threads + 1)
+
+    # Every thread keeps retrying its own file against a flaky server, so each of its retry
+    # lines repeats with a fresh but identical error, which is what the rate limit is for
+    def worker(filename):
+        barrier.wait()
+        for message in range(messages):
+            attempt = message % RETRIES + 1
+            error = ConnectionError("Connection reset by peer")
+
+            if lazy:
+                logger.debug(
+                    "(Attempt %s of %s) - Error downloading file %s: %s",
+                    attempt,
+                    RETRIES,
+                    filename,
+                    error,
+                )
+            else:
+                logger.debug(
+                    f"(Attempt {attempt} of {RETRIES}) - Error downloading file {filename}: {error}"
+                )
+
+    workers = [
+        threading.Thread(target=worker, args=(f"file_{index}.pdf",))
+        for index in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+
+    barrier.wait()
+    start_time = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start_time
+
+
+def bench_file_handler(path, threads, messages):
+    logger = logging.getLogger("bench.file_handler")
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    logger.addHandler(handler)
+
+    elapsed = run_threads(logger, threads, messages, lazy=False)
+
+    logger.removeHandler(handler)
+    handler.close()
+    return elapsed, elapsed
+
+
+def bench_queue_handler(path, threads, messages, rate_limit=False):
+    logger = logging.getLogger(f"bench.queue_handler.{rate_limit}")
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter(FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    if rate_limit:
+        queue_handler.addFilter(RateLimitFilter())
+    logger.addHandler(queue_handler)
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+
+    start_time = time.perf_counter()
+    elapsed = run_threads(logger, threads, messages, lazy=True)
+    listener.stop()
+    drained = time.perf_counter() - start_time
+
+    logger.removeHandler(queue_handler)
+    handler.close()
+    return elapsed, drained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.getLogger("bench").setLevel(logging.DEBUG)
+    logging.getLogger("bench").propagate = False
+    total = args.threads * args.messages
+
+    print(f"{args.threads} threads x {args.messages} messages = {total} records")
+    print(
+        f"{'setup':<14}{'in threads (s)':>16}{'until on disk (s)':>20}{'us/record':>12}{'written':>10}"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, bench in [
+            ("FileHandler", bench_file_handler),
+            ("QueueHandler", bench_queue_handler),
+            (
+                "+ RateLimit",
+                lambda *bench_args: bench_queue_handler(*bench_args, rate_limit=True),
+            ),
+        ]:
+            path = os.path.join(tmp_dir, f"{name}.log")
+            elapsed, drained = bench(path, args.threads, args.messages)
+
+            with open(path) as f:
+                written = sum(1 for _ in f)
+
+            print(
+                f"{name:<14}{elapsed:>16.3f}{drained:>20.3f}{elapsed / total * 1e6:>12.2f}{written:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import logging
+import threading
+from concurrent.futures import Future
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443, "ftp": 21, "sftp": 22}
+
+
+def normalize_uri(uri):
+    parts = urlsplit(uri.strip())
+    scheme = parts.scheme.lower()
+
+    netloc = parts.hostname or ""
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{parts.port}"
+
+    # Credentials stay in the key since different accounts may see different files
+    if parts.username:
+        userinfo = parts.username
+        if parts.password:
+            userinfo = f"{userinfo}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def link_or_copy(source_path, target_path):
+    if os.path.abspath(source_path) == os.path.abspath(target_path):
+        return
+
+    if os.path.exists(target_path):
+        os.remove(target_path)
+
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        # Hardlinks do not work across filesystems or on some network mounts
+        shutil.copy2(source_path, target_path)
+
+
+class InflightCoalescer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.transfers = {}
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def run(self, uri, dest_dir, download, place):
+        # download() fetches the file into dest_dir, place(path) reuses a copy fetched elsewhere.
+        # Both return the local filepath, or None on failure.
+        key = normalize_uri(uri)
+        dest_key = os.path.abspath(dest_dir)
+
+        with self.lock:
+            transfers = self.transfers.setdefault(key, {})
+            future = transfers.get(dest_key)
+
+            if future is None:
+                source = next(iter(transfers.values()), None)
+                future = transfers[dest_key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            self.logger.info("%s is already being downloaded, waiting for it", uri)
+            return future.result()
+
+        try:
+            result = None
+
+            if source is not None:
+                try:
+                    source_path = source.result()
+                    if source_path:
+                        self.logger.info("Reusing %s for %s", source_path, uri)
+                        result = place(source_path)
+                except Exception as e:
+                    self.logger.warning("Could not reuse download of %s: %s", uri, e)
+
+            if result is None:
+                result = download()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            # Only transfers still running are shared. Requests already waiting hold the future,
+            # and a later request for the same file starts a fresh transfer.
+            with self.lock:
+                transfers.pop(dest_key, None)
+                if not transfers and self.transfers.get(key) is transfers:
+                    del self.transfers[key]
+
+        return result
@@ -1,29 +1,136 @@
+import os
 import logging
 import threading
+from downloader.coalescer import InflightCoalescer, normalize_uri
+from downloader.helper import DownloadManifest
+from downloader.integrity import checksum_from_sidecar
+from downloader.mirror_downloader import MirrorDownloader
+from downloader.planner import DownloadPlanner, format_size
 from downloader.protocols.ftp_handler import FTPHandler
 from downloader.protocols.http_handler import HTTPHandler
 from downloader.protocols.sftp_handler import SFTPHandler
+from downloader.tracing import NULL_TRACER
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 class Downloader:
-    def __init__(self, uris, dest_dir, retries, max_workers=None):
+    SIDECAR_EXTENSION = ".sha256"
+    SIDECAR_MAX_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        uris,
+        dest_dir,
+        retries,
+        max_workers=None,
+        checksums=None,
+        tracer=None,
+        plan=True,
+        coalescer=None,
+        segments=1,
+        host_segments=None,
+        sidecar_checksums=False,
+    ):
+        # Each entry is either a single URI or a list of mirror URIs for the same file
         self.uris = uris
         self.dest_dir = dest_dir
         self.retries = retries
         self.max_workers = max_workers if max_workers else len(uris)
+        self.checksums = checksums or {}
+        self.sidecar_checksums = sidecar_checksums
+        self.tracer = tracer or NULL_TRACER
+        self.plan_downloads = plan
+        # A coalescer shared between downloaders lets them reuse each other's transfers
+        self.coalescer = coalescer or InflightCoalescer()
         self.stop_event = threading.Event()
         self.logger = logging.getLogger(self.__class__.__name__)
+        # One manifest for all handlers, so downloads over different protocols are all kept
+        self.manifest = DownloadManifest()
         self.protocol_handlers = {
-            "http": HTTPHandler(self.stop_event),
-            "https": HTTPHandler(self.stop_event),
-            "ftp": FTPHandler(self.stop_event),
-            "sftp": SFTPHandler(self.stop_event),
+            "http": HTTPHandler(
+                self.stop_event, tracer=self.tracer, manifest=self.manifest
+            ),
+            "https": HTTPHandler(
+                self.stop_event, tracer=self.tracer, manifest=self.manifest
+            ),
+            "ftp": FTPHandler(
+                self.stop_event,
+                tracer=self.tracer,
+                segments=segments,
+                host_segments=host_segments,
+                manifest=self.manifest,
+            ),
+            "sftp": SFTPHandler(
+                self.stop_event,
+                tracer=self.tracer,
+                segments=segments,
+                host_segments=host_segments,
+                manifest=self.manifest,
+            ),
         }
+        self.mirror_downloader = MirrorDownloader(
+            self.protocol_handlers, self.stop_event
+        )
+        self.planner = DownloadPlanner(self.protocol_handlers)
+
+    def plan(self):
+        return self._plan(self._unique_uris())
+
+    def _plan(self, uris):
+        with self.tracer.span("plan", files=len(uris)):
+            return self.planner.plan(uris, self.dest_dir, self.max_workers)
+
+    def _unique_uris(self):
+        unique_uris = {}
+
+        for uri in self.uris:
+            mirrors = list(uri) if isinstance(uri, (list, tuple)) else [uri]
+            key = normalize_uri(mirrors[0])
+            kept = unique_uris.get(key)
+
+            if kept is None:
+                unique_uris[key] = uri
+                continue
+
+            # A duplicate that brings mirrors of its own is merged in instead of being dropped
+            kept_mirrors = list(kept) if isinstance(kept, (list, tuple)) else [kept]
+            known = {normalize_uri(mirror) for mirror in kept_mirrors}
+            extra = [mirror for mirror in mirrors if normalize_uri(mirror) not in known]
+
+            if extra:
+                unique_uris[key] = kept_mirrors + extra
+                self.logger.info(
+                    "Merged duplicate uri %s into a group of %s mirrors",
+                    mirrors[0],
+                    len(kept_mirrors) + len(extra),
+                )
+            else:
+                self.logger.info("Skipping duplicate uri: %s", mirrors[0])
+
+        return list(unique_uris.values())
 
     def download_files(self):
+        uris = self._unique_uris()
+        sizes = {}
+
+        if self.plan_downloads:
+            plan = self._plan(uris)
+
+            if not plan.fits:
+                self.logger.error(
+                    "Not enough free space in %s: need %s, %s available",
+                    self.dest_dir,
+                    format_size(plan.total_bytes),
+                    format_size(plan.free_bytes),
+                )
+                return
+
+            uris = plan.uris
+            # Handing on the sizes probed for the plan saves asking each server again
+            sizes = plan.sizes
+
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = [executor.submit(self._download_file, uri) for uri in self.uris]
+            futures = [executor.submit(self._download_file, uri, sizes) for uri in uris]
 
             try:
                 for future in as_completed(futures):
@@ -34,16 +141,80 @@ class Downloader:
                 self.stop_event.set()
                 return
 
-    def _download_file(self, uri):
-        self.logger.info(f"Downloading from {uri} ...")
+    def _download_file(self, uri, sizes=None):
+        first_uri = uri[0] if isinstance(uri, (list, tuple)) else uri
+
+        return self.coalescer.run(
+            first_uri,
+            self.dest_dir,
+            lambda: self._transfer(uri, sizes or {}),
+            lambda source_path: self._copy_from(source_path, first_uri),
+        )
+
+    def _transfer(self, uri, sizes):
+        if isinstance(uri, (list, tuple)):
+            if len(uri) > 1:
+                return self._download_from_mirrors(uri, sizes)
+            uri = uri[0]
+
+        self.logger.info("Downloading from %s ...", uri)
 
         protocol = uri.split("://")[0]
         handler = self.protocol_handlers.get(protocol)
 
         if handler:
             try:
-                handler.download_file(uri, self.dest_dir, self.retries)
+                checksum = self._checksum_for(uri)
+
+                with self.tracer.span("download", uri=uri):
+                    return handler.download_file(
+                        uri, self.dest_dir, self.retries, checksum, sizes.get(uri)
+                    )
             except Exception as e:
-                self.logger.error(f"Failed to download {uri}: {e}")
+                self.logger.error("Failed to download %s: %s", uri, e)
         else:
-            self.logger.warning(f"Unsupported protocol in uri: {uri}")
+            self.logger.warning("Unsupported protocol in uri: %s", uri)
+
+    def _download_from_mirrors(self, uris, sizes):
+        self.logger.info("Downloading from %s mirrors of %s ...", len(uris), uris[0])
+
+        try:
+            checksum = self._checksum_for(uris[0])
+
+            with self.tracer.span("download", uri=uris[0], mirrors=len(uris)):
+                return self.mirror_downloader.download_file(
+                    uris, self.dest_dir, self.retries, checksum, sizes
+                )
+        except Exception as e:
+            self.logger.error("Failed to download %s: %s", uris[0], e)
+
+    def _checksum_for(self, uri):
+        if uri in self.checksums:
+            return self.checksums[uri]
+
+        if not self.sidecar_checksums:
+            return None
+
+        # Published checksums usually sit next to the file as "<name>.sha256"
+        sidecar_uri = uri + self.SIDECAR_EXTENSION
+        handler = self.protocol_handlers.get(uri.split("://")[0])
+
+        try:
+            text = handler.fetch_small_file(sidecar_uri, self.SIDECAR_MAX_SIZE)
+            checksum = checksum_from_sidecar(
+                text.decode("utf-8", "replace"), os.path.basename(uri)
+            )
+        except Exception as e:
+            self.logger.warning("Could not fetch checksum from %s: %s", sidecar_uri, e)
+            return None
+
+        if checksum is None:
+            self.logger.warning("No checksum for %s found in %s", uri, sidecar_uri)
+
+        return checksum
+
+    def _copy_from(self, source_path, uri):
+        handler = self.protocol_handlers.get(uri.split("://")[0])
+
+        if handler:
+            return handler.copy_from(source_path, uri, self.dest_dir)
@@ -1,14 +1,56 @@
 import json
+import threading
 
+MANIFEST_PATH = "downloaded_files.json"
 
-def load_downloaded_files():
+
+def load_downloaded_files(path=MANIFEST_PATH):
     try:
-        with open("downloaded_files.json", "r") as file:
+        with open(path, "r") as file:
             return json.load(file)
     except FileNotFoundError:
         return {}
 
 
-def save_downloaded_files(downloaded_files):
-    with open("downloaded_files.json", "w") as file:
+def save_downloaded_files(downloaded_files, path=MANIFEST_PATH):
+    with open(path, "w") as file:
         json.dump(downloaded_files, file, indent=4)
+
+
+class DownloadManifest:
+    # Every handler rewrites the whole file when it records a download, so they all have to
+    # share one instance for entries from different protocols and threads to survive
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.entries = load_downloaded_files(path)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def record(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            save_downloaded_files(self.entries, self.path)
+
+
+def preallocate_file(filepath, size):
+    # Preallocating lets every segment be written in place at its own offset
+    with open(filepath, "wb") as file:
+        file.truncate(size)
+
+
+def fetch_range(handler, uri, filepath, segment, cancelled=None):
+    # segment is a mutable [start, end] pair whose start advances as bytes land on disk,
+    # so a failed fetch leaves behind exactly the part still missing
+    with open(filepath, "r+b") as file:
+        file.seek(segment[0])
+
+        def callback(data):
+            if cancelled is not None and cancelled.is_set():
+                raise InterruptedError("Segment cancelled.")
+
+            file.write(data)
+            segment[0] += len(data)
+
+        handler.read_range(uri, segment[0], segment[1], callback)
@@ -0,0 +1,117 @@
+import re
+import base64
+import binascii
+import hashlib
+
+DEFAULT_ALGORITHM = "sha256"
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Algorithm names used by the Digest (RFC 3230) and Repr-Digest (RFC 9530) headers
+HEADER_ALGORITHMS = {
+    "sha-512": "sha512",
+    "sha-256": "sha256",
+    "sha": "sha1",
+    "md5": "md5",
+}
+
+
+class ChecksumMismatchError(Exception):
+    pass
+
+
+def parse_checksum(checksum):
+    # Accepts "<algorithm>:<hexdigest>" or a bare hex digest, which is assumed to be SHA-256
+    algorithm, separator, hexdigest = checksum.partition(":")
+
+    if not separator:
+        algorithm, hexdigest = DEFAULT_ALGORITHM, checksum
+
+    algorithm = algorithm.lower().replace("-", "")
+
+    if algorithm not in hashlib.algorithms_available:
+        raise ValueError(f"Unsupported checksum algorithm '{algorithm}'")
+
+    return algorithm, hexdigest.strip().lower()
+
+
+def format_checksum(algorithm, hexdigest):
+    return f"{algorithm}:{hexdigest}"
+
+
+def new_hasher(checksum=None):
+    algorithm = parse_checksum(checksum)[0] if checksum else DEFAULT_ALGORITHM
+    return hashlib.new(algorithm)
+
+
+def check_hasher(hasher, checksum, filename):
+    # Returns the digest of everything fed to the hasher, in the same form as a checksum option
+    digest = format_checksum(hasher.name, hasher.hexdigest())
+
+    if checksum and digest != format_checksum(*parse_checksum(checksum)):
+        raise ChecksumMismatchError(
+            f"Checksum mismatch for {filename}: expected {checksum}, got {digest}"
+        )
+
+    return digest
+
+
+def checksum_from_headers(headers):
+    # Header digests cover the encoded body, which requests decodes on the fly
+    if headers.get("Content-Encoding", "identity") != "identity":
+        return None
+
+    for header in ["Repr-Digest", "Digest"]:
+        digests = {}
+        for item in headers.get(header, "").split(","):
+            name, _, encoded = item.strip().partition("=")
+            digests[name.lower()] = encoded.strip(":")
+
+        # Servers may list several digests, so take the strongest one offered
+        for name, algorithm in HEADER_ALGORITHMS.items():
+            if name not in digests:
+                continue
+
+            try:
+                digest = base64.b64decode(digests[name], validate=True)
+            except (ValueError, binascii.Error):
+                continue
+
+            return format_checksum(algorithm, digest.hex())
+
+    return None
+
+
+def checksum_from_sidecar(text, filename, algorithm=DEFAULT_ALGORITHM):
+    # Handles both "<digest>  <filename>" and BSD style "SHA256 (<filename>) = <digest>" lines,
+    # preferring the line naming the file when the sidecar lists several
+    lines = [line for line in text.splitlines() if line.strip()]
+    hex_length = hashlib.new(algorithm).digest_size * 2
+
+    for line in [line for line in lines if filename in line] or lines[:1]:
+        match = re.search(rf"\b[0-9a-fA-F]{{{hex_length}}}\b", line)
+        if match:
+            return format_checksum(algorithm, match.group(0).lower())
+
+    return None
+
+
+def file_digest(filepath, algorithm=DEFAULT_ALGORITHM):
+    hasher = hashlib.new(algorithm)
+
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+
+def verify_file(filepath, checksum):
+    algorithm, expected = parse_checksum(checksum)
+    actual = file_digest(filepath, algorithm)
+
+    if actual != expected:
+        raise ChecksumMismatchError(
+            f"{algorithm} mismatch for {filepath}: expected {expected}, got {actual}"
+        )
+
+    return format_checksum(algorithm, actual)
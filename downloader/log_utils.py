@@ -0,0 +1,99 @@
+import json
+import time
+import logging
+import threading
+from logging.handlers import QueueHandler
+
+
+class DeferredQueueHandler(QueueHandler):
+    # The stock QueueHandler formats every record in the calling thread before enqueueing it.
+    # Records here never leave the process, so they are passed through as-is and the listener
+    # thread pays for formatting instead of the download threads.
+    def prepare(self, record):
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    DEFAULT_RATE = 10
+    DEFAULT_PERIOD = 1.0
+    SHARDS = 16
+    PLAIN_TYPES = (str, int, float, bool, type(None))
+
+    def __init__(self, rate=DEFAULT_RATE, period=DEFAULT_PERIOD, level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        self.level = level
+        # Windows are split across several locks so threads logging different messages
+        # rarely wait on each other
+        self.locks = [threading.Lock() for _ in range(self.SHARDS)]
+        self.windows = [{} for _ in range(self.SHARDS)]
+        self.last_prune = [time.monotonic()] * self.SHARDS
+
+    def _key(self, record):
+        # Arguments such as exceptions are compared by their text, the same way they appear in
+        # the message, so a retry raising a fresh but identical error still counts as a repeat.
+        # This converts only the arguments and leaves formatting the message to the listener.
+        if isinstance(record.args, tuple):
+            args = tuple(
+                arg if isinstance(arg, self.PLAIN_TYPES) else str(arg)
+                for arg in record.args
+            )
+            return (record.name, record.levelno, record.msg, args)
+
+        return (record.name, record.levelno, record.getMessage())
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+
+        key = self._key(record)
+        shard = hash(key) % self.SHARDS
+        now = time.monotonic()
+
+        with self.locks[shard]:
+            windows = self.windows[shard]
+
+            # Most messages never repeat, so windows that have run out are dropped once a period
+            if now - self.last_prune[shard] >= self.period:
+                windows = self.windows[shard] = {
+                    window_key: window
+                    for window_key, window in windows.items()
+                    if now - window[0] < self.period or window[2]
+                }
+                self.last_prune[shard] = now
+
+            window_start, count, suppressed = windows.get(key, (now, 0, 0))
+
+            if now - window_start >= self.period:
+                window_start, count = now, 0
+
+            if count >= self.rate:
+                windows[key] = (window_start, count, suppressed + 1)
+                return False
+
+            windows[key] = (window_start, count + 1, 0)
+
+        if suppressed:
+            record.msg = (
+                f"{record.getMessage()} ({suppressed} identical messages suppressed)"
+            )
+            record.args = ()
+
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry)
@@ -0,0 +1,296 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from downloader.helper import fetch_range, preallocate_file
+from downloader.integrity import verify_file
+
+
+class MirrorDownloader:
+    DEFAULT_PROBE_SIZE = 256 * 1024
+    DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+    DEFAULT_SEGMENT_THRESHOLD = 32 * 1024 * 1024
+    STOP_POLL_INTERVAL = 0.5
+
+    def __init__(
+        self,
+        protocol_handlers,
+        stop_event,
+        probe_size=DEFAULT_PROBE_SIZE,
+        segment_size=DEFAULT_SEGMENT_SIZE,
+        segment_threshold=DEFAULT_SEGMENT_THRESHOLD,
+    ):
+        self.protocol_handlers = protocol_handlers
+        self.stop_requested = stop_event
+        self.probe_size = probe_size
+        self.segment_size = segment_size
+        self.segment_threshold = segment_threshold
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def download_file(self, uris, dest_dir, retries, checksum=None, sizes=None):
+        # sizes maps mirror uris to sizes already probed, for example while planning
+        sources = []
+        for uri in uris:
+            handler = self.protocol_handlers.get(uri.split("://")[0])
+
+            if handler:
+                sources.append((uri, handler))
+            else:
+                self.logger.warning("Unsupported protocol in mirror uri: %s", uri)
+
+        if not sources:
+            self.logger.error("No usable mirrors for %s", uris[0])
+            return
+
+        # The first mirror names the file and owns the manifest entry
+        primary_uri, primary_handler = sources[0]
+        filename = os.path.basename(primary_uri)
+
+        if not primary_handler.ensure_directory(dest_dir):
+            return
+
+        if primary_handler.is_verified(primary_uri, dest_dir, checksum):
+            self.logger.info(
+                "'%s' in '%s' already matches its checksum, skipping",
+                filename,
+                dest_dir,
+            )
+            return primary_handler.get_local_filepath(primary_uri, dest_dir)
+
+        size, sources = self._resolve_size(sources, sizes or {})
+
+        if size is None:
+            self.logger.warning(
+                "Could not determine the size of '%s', downloading from one mirror at a time",
+                filename,
+            )
+            return self._download_without_size(sources, dest_dir, retries, checksum)
+
+        sources = self._rank_sources(sources, size)
+
+        if not sources:
+            self.logger.error("All mirrors for '%s' failed the speed probe", filename)
+            return
+
+        local_filepath = primary_handler.get_local_filepath(primary_uri, dest_dir)
+
+        try:
+            preallocate_file(local_filepath, size)
+
+            if size >= self.segment_threshold and len(sources) > 1:
+                self._download_segmented(sources, size, local_filepath, retries)
+            else:
+                self._download_sequential(sources, size, local_filepath, retries)
+
+            digest = self._verify(local_filepath, size, checksum)
+        except KeyboardInterrupt as e:
+            self.logger.error("Failed to download %s: %s", filename, e)
+            primary_handler.cleanup_file(local_filepath)
+            return
+        except Exception as e:
+            self.logger.error("Failed to download '%s' from mirrors: %s", filename, e)
+            primary_handler.cleanup_file(local_filepath)
+            return
+
+        self.logger.info(
+            "Successfully downloaded '%s' to '%s' from %s mirror(s)",
+            filename,
+            dest_dir,
+            len(sources),
+        )
+
+        primary_handler.record_download(primary_uri, dest_dir, local_filepath, digest)
+        return local_filepath
+
+    def _resolve_size(self, sources, known_sizes):
+        def probe(source):
+            uri, handler = source
+            if uri in known_sizes:
+                return known_sizes[uri]
+
+            try:
+                return handler.get_file_size(uri)
+            except Exception as e:
+                self.logger.debug("Could not get size of %s: %s", uri, e)
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            sizes = list(executor.map(probe, sources))
+
+        known_sizes = Counter(size for size in sizes if size is not None)
+        if not known_sizes:
+            return None, sources
+
+        # Mirrors disagreeing with the majority are most likely serving a different version
+        size = known_sizes.most_common(1)[0][0]
+        consistent = []
+        for (uri, handler), mirror_size in zip(sources, sizes):
+            if mirror_size == size:
+                consistent.append((uri, handler))
+            else:
+                self.logger.warning(
+                    "Skipping mirror %s: reported size %s, expected %s",
+                    uri,
+                    mirror_size,
+                    size,
+                )
+
+        return size, consistent
+
+    def _rank_sources(self, sources, size):
+        probe_end = min(self.probe_size, size)
+
+        def measure(source):
+            uri, handler = source
+            received = 0
+
+            def callback(data):
+                nonlocal received
+                received += len(data)
+
+            start_time = time.monotonic()
+            try:
+                handler.read_range(uri, 0, probe_end, callback)
+            except Exception as e:
+                self.logger.warning(
+                    "Skipping mirror %s: speed probe failed: %s", uri, e
+                )
+                return None
+
+            elapsed = max(time.monotonic() - start_time, 1e-6)
+            self.logger.debug("Mirror %s probed at %.0f B/s", uri, received / elapsed)
+            return received / elapsed
+
+        if probe_end == 0 or len(sources) == 1:
+            return sources
+
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            throughputs = list(executor.map(measure, sources))
+
+        ranked = sorted(
+            (
+                (throughput, index)
+                for index, throughput in enumerate(throughputs)
+                if throughput is not None
+            ),
+            reverse=True,
+        )
+        return [sources[index] for _, index in ranked]
+
+    def _download_sequential(self, sources, size, local_filepath, retries):
+        segment = [0, size]
+
+        for uri, handler in sources:
+            for attempt in range(1, retries + 1):
+                if segment[0] >= segment[1]:
+                    return
+
+                try:
+                    fetch_range(handler, uri, local_filepath, segment)
+                    return
+                except Exception as e:
+                    self.logger.debug(
+                        "(Attempt %s of %s) - Mirror %s failed at byte %s: %s",
+                        attempt,
+                        retries,
+                        uri,
+                        segment[0],
+                        e,
+                    )
+
+            self.logger.warning(
+                "Failing over from mirror %s at byte %s", uri, segment[0]
+            )
+
+        if segment[0] < segment[1]:
+            raise OSError(
+                f"All mirrors failed with {segment[1] - segment[0]} bytes left"
+            )
+
+    def _download_segmented(self, sources, size, local_filepath, retries):
+        pending = deque(
+            [start, min(start + self.segment_size, size)]
+            for start in range(0, size, self.segment_size)
+        )
+        condition = threading.Condition()
+        in_flight = 0
+
+        def worker(uri, handler):
+            nonlocal in_flight
+            failures = 0
+
+            while failures < retries:
+                with condition:
+                    # Stay around while other mirrors hold segments, they may hand them back on failure
+                    while (
+                        not pending and in_flight and not self.stop_requested.is_set()
+                    ):
+                        # Timed so a stop request is noticed even if no segment is handed back
+                        condition.wait(self.STOP_POLL_INTERVAL)
+
+                    if not pending or self.stop_requested.is_set():
+                        return
+
+                    segment = pending.popleft()
+                    in_flight += 1
+
+                try:
+                    fetch_range(handler, uri, local_filepath, segment)
+                except Exception as e:
+                    failures += 1
+                    self.logger.debug(
+                        "(Attempt %s of %s) - Mirror %s failed at byte %s: %s",
+                        failures,
+                        retries,
+                        uri,
+                        segment[0],
+                        e,
+                    )
+                finally:
+                    # Also runs on KeyboardInterrupt, so waiting workers are woken to notice the stop
+                    with condition:
+                        in_flight -= 1
+                        if segment[0] < segment[1]:
+                            pending.appendleft(segment)
+                        condition.notify_all()
+
+            self.logger.warning("Dropping mirror %s after %s failures", uri, retries)
+
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            futures = [
+                executor.submit(worker, uri, handler) for uri, handler in sources
+            ]
+            for future in futures:
+                future.result()
+
+        if self.stop_requested.is_set():
+            raise KeyboardInterrupt("Download interrupted.")
+
+        if pending:
+            missing = sum(end - start for start, end in pending)
+            raise OSError(f"All mirrors failed with {missing} bytes left")
+
+    def _download_without_size(self, sources, dest_dir, retries, checksum):
+        for uri, handler in sources:
+            # The handler checks the checksum as the data arrives, so a corrupt copy fails over here
+            try:
+                local_filepath = handler.download_file(uri, dest_dir, retries, checksum)
+            except Exception as e:
+                self.logger.warning("Failing over from mirror %s: %s", uri, e)
+                continue
+
+            if local_filepath:
+                return local_filepath
+
+        self.logger.error("Failed to download %s from any mirror", sources[0][0])
+
+    def _verify(self, local_filepath, size, checksum):
+        actual_size = os.path.getsize(local_filepath)
+        if actual_size != size:
+            raise OSError(f"Expected {size} bytes, got {actual_size}")
+
+        # Segments from different mirrors arrive out of order, so the file is hashed once complete
+        if checksum:
+            return verify_file(local_filepath, checksum)
@@ -0,0 +1,138 @@
+import os
+import heapq
+import shutil
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def format_size(num_bytes):
+    if num_bytes is None:
+        return "unknown"
+
+    size = float(num_bytes)
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024
+
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
+class DownloadPlan:
+    def __init__(self, entries, dest_dir, workers, free_bytes, sizes=None):
+        # entries are (uri, size) pairs in the order they should be started, sizes has the
+        # probed size of every uri including each mirror, None where the probe failed
+        self.entries = entries
+        self.sizes = sizes or {}
+        self.dest_dir = dest_dir
+        self.workers = workers
+        self.free_bytes = free_bytes
+        self.total_bytes = sum(size for _, size in entries if size is not None)
+        self.unknown_count = sum(1 for _, size in entries if size is None)
+        self.makespan_bytes = self._estimate_makespan()
+
+    @property
+    def uris(self):
+        return [uri for uri, _ in self.entries]
+
+    @property
+    def fits(self):
+        return self.free_bytes is None or self.total_bytes <= self.free_bytes
+
+    def _estimate_makespan(self):
+        # Replays the schedule: every file goes to whichever worker frees up first
+        loads = [0] * max(1, min(self.workers, len(self.entries)))
+        for _, size in self.entries:
+            heapq.heappush(loads, heapq.heappop(loads) + (size or 0))
+
+        return max(loads)
+
+    def describe(self):
+        lines = [
+            f"Download plan for {len(self.entries)} file(s) in '{self.dest_dir}' using {self.workers} worker(s):"
+        ]
+
+        for uri, size in self.entries:
+            name = uri[0] if isinstance(uri, (list, tuple)) else uri
+            lines.append(f"  {format_size(size):>10}  {name}")
+
+        total = f"Estimated total: {format_size(self.total_bytes)}"
+        if self.unknown_count:
+            total += f" (plus {self.unknown_count} file(s) of unknown size)"
+
+        lines.append(total)
+        lines.append(f"Busiest worker: {format_size(self.makespan_bytes)}")
+        lines.append(f"Free space: {format_size(self.free_bytes)}")
+
+        if not self.fits:
+            lines.append("Not enough free space for this batch")
+
+        return "\n".join(lines)
+
+
+class DownloadPlanner:
+    MAX_PROBE_WORKERS = 32
+
+    def __init__(self, protocol_handlers):
+        self.protocol_handlers = protocol_handlers
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def plan(self, uris, dest_dir, workers):
+        # Every mirror of a group is probed, so mirror downloads can check them against each other
+        # without asking each server again
+        probe_uris = list(
+            dict.fromkeys(mirror for uri in uris for mirror in self._mirrors(uri))
+        )
+
+        if probe_uris:
+            with ThreadPoolExecutor(
+                max_workers=min(len(probe_uris), self.MAX_PROBE_WORKERS)
+            ) as executor:
+                sizes = dict(zip(probe_uris, executor.map(self._probe, probe_uris)))
+        else:
+            sizes = {}
+
+        # Longest first, so big files start early and small ones fill in around them at the end.
+        # Files of unknown size go first of all, since one of them may well be the largest.
+        entries = sorted(
+            ((uri, self._entry_size(uri, sizes)) for uri in uris),
+            key=lambda entry: (entry[1] is not None, -(entry[1] or 0)),
+        )
+
+        return DownloadPlan(
+            entries, dest_dir, workers, self._free_space(dest_dir), sizes
+        )
+
+    def _mirrors(self, uri):
+        return uri if isinstance(uri, (list, tuple)) else [uri]
+
+    def _probe(self, uri):
+        handler = self.protocol_handlers.get(uri.split("://")[0])
+        if not handler:
+            return None
+
+        try:
+            return handler.get_file_size(uri)
+        except Exception as e:
+            self.logger.debug("Could not get size of %s: %s", uri, e)
+            return None
+
+    def _entry_size(self, uri, sizes):
+        # Mirrors of a group should agree, the majority wins if they do not
+        known_sizes = Counter(
+            sizes[mirror] for mirror in self._mirrors(uri) if sizes[mirror] is not None
+        )
+        return known_sizes.most_common(1)[0][0] if known_sizes else None
+
+    def _free_space(self, dest_dir):
+        # dest_dir may not exist yet, so measure the closest directory that does
+        path = os.path.abspath(dest_dir)
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+
+        try:
+            return shutil.disk_usage(path).free
+        except OSError as e:
+            self.logger.warning("Could not check free space in %s: %s", dest_dir, e)
+            return None
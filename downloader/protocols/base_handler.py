@@ -1,32 +1,110 @@
 import os
+import time
+import socket
 import logging
+import threading
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from downloader.helper import load_downloaded_files
+from downloader.coalescer import link_or_copy
+from downloader.helper import DownloadManifest, fetch_range, preallocate_file
+from downloader.integrity import format_checksum, parse_checksum, verify_file
+from downloader.tracing import NULL_TRACER
 
 
 class BaseHandler:
-    def __init__(self, logger_name, stop_event):
+    DEFAULT_MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+
+    def __init__(
+        self,
+        logger_name,
+        stop_event,
+        tracer=None,
+        segments=1,
+        host_segments=None,
+        min_segment_size=DEFAULT_MIN_SEGMENT_SIZE,
+        manifest=None,
+    ):
         self.logger = logging.getLogger(logger_name)
         self.stop_requested = stop_event
-        self.downloaded_files = load_downloaded_files()
+        self.tracer = tracer or NULL_TRACER
+        self.segments = segments
+        self.host_segments = host_segments or {}
+        self.min_segment_size = min_segment_size
+        self.manifest = manifest or DownloadManifest()
 
-    def _ensure_directory(self, path):
+    def ensure_directory(self, path):
         try:
             os.makedirs(path, exist_ok=True)
             return True
         except OSError as e:
-            self.logger.error(f"Failed to create directory {path}: {e}")
+            self.logger.error("Failed to create directory %s: %s", path, e)
+            return False
+
+    def copy_from(self, source_path, uri, dest_dir):
+        if not self.ensure_directory(dest_dir):
+            return
+
+        local_filepath = self.get_local_filepath(uri, dest_dir)
+        link_or_copy(source_path, local_filepath)
+        self.logger.info("Reused %s as %s", source_path, local_filepath)
+
+        self.record_download(uri, dest_dir, local_filepath)
+        return local_filepath
+
+    def fetch_small_file(self, uri, max_size):
+        size = self.get_file_size(uri)
+
+        if size is None or size > max_size:
+            raise ValueError(f"{uri} is not a small file (size: {size})")
+
+        data = bytearray()
+        if size:
+            self.read_range(uri, 0, size, data.extend)
+        return bytes(data)
+
+    def record_download(self, uri, dest_dir, local_filepath, digest=None):
+        entry = local_filepath
+
+        if digest:
+            entry = {"path": local_filepath, "digest": digest}
+
+            # Size and modification time tell later runs whether the file is still the one hashed
+            try:
+                stat = os.stat(local_filepath)
+                entry["size"] = stat.st_size
+                entry["mtime"] = stat.st_mtime
+            except OSError:
+                pass
+
+        # Saving downloaded filepath to manage name collisions
+        key = f"{uri}|{dest_dir}"
+        self.manifest.record(key, entry)
+
+    def is_verified(self, uri, dest_dir, checksum):
+        entry = self.manifest.get(f"{uri}|{dest_dir}")
+
+        if not checksum or not isinstance(entry, dict):
+            return False
+
+        if entry.get("digest") != format_checksum(*parse_checksum(checksum)):
             return False
 
-    def _cleanup_file(self, filepath):
+        try:
+            stat = os.stat(entry["path"])
+        except OSError:
+            return False
+
+        return stat.st_size == entry.get("size") and stat.st_mtime == entry.get("mtime")
+
+    def cleanup_file(self, filepath):
         try:
             os.remove(filepath)
-            self.logger.info(f"Removed partial download {filepath}")
+            self.logger.info("Removed partial download %s", filepath)
         except FileNotFoundError:
-            self.logger.warning(f"No file to remove at {filepath}")
+            self.logger.warning("No file to remove at %s", filepath)
         except OSError as e:
-            self.logger.error(f"Failed to remove partial download {filepath}: {e}")
+            self.logger.error("Failed to remove partial download %s: %s", filepath, e)
 
     def _parse_uri(self, uri, default_port):
         parsed_uri = urlparse(uri)
@@ -39,23 +117,138 @@ class BaseHandler:
 
         return hostname, int(port), username, password, remote_path
 
+    def _trace_dns(self, hostname, port):
+        if not self.tracer.enabled:
+            return
+
+        # Client libraries resolve and connect in a single call, so while tracing the lookup is
+        # repeated on its own beforehand to measure it
+        with self.tracer.span("dns", host=hostname):
+            try:
+                socket.getaddrinfo(hostname, port, type=socket.SOCK_STREAM)
+            except OSError:
+                pass
+
+    def _make_writer(self, f, span_args, hasher, ttfb=True):
+        # Hashing the bytes on their way to disk saves reading the file back to verify it
+        if not self.tracer.enabled:
+
+            def write(data):
+                hasher.update(data)
+                f.write(data)
+
+            return write
+
+        transfer_start = self.tracer.now()
+        span_args["bytes"] = 0
+        span_args["hash_ms"] = 0.0
+        span_args["write_ms"] = 0.0
+
+        def traced_write(data):
+            if ttfb and not span_args["bytes"]:
+                self.tracer.add_span("ttfb", transfer_start, self.tracer.now())
+
+            hash_start = time.perf_counter()
+            hasher.update(data)
+            write_start = time.perf_counter()
+            f.write(data)
+            write_end = time.perf_counter()
+
+            span_args["hash_ms"] += (write_start - hash_start) * 1000
+            span_args["write_ms"] += (write_end - write_start) * 1000
+            span_args["bytes"] += len(data)
+
+        return traced_write
+
+    def _plan_segments(self, uri, hostname, size=None):
+        # Returns the [start, end] ranges to fetch in parallel, or None when the file should be
+        # fetched over a single connection instead
+        segments = self.host_segments.get(hostname, self.segments)
+        if segments <= 1:
+            return None
+
+        if size is None:
+            try:
+                size = self.get_file_size(uri)
+            except Exception as e:
+                self.logger.debug("Could not get size of %s for segmenting: %s", uri, e)
+                return None
+
+        segments = min(segments, (size or 0) // self.min_segment_size)
+        if segments <= 1:
+            return None
+
+        bounds = [size * index // segments for index in range(segments + 1)]
+        return [[start, end] for start, end in zip(bounds, bounds[1:])]
+
+    def _attempt_segmented_download(
+        self, uri, hostname, local_filepath, pending, size=None
+    ):
+        # pending holds the ranges still missing and is kept by the caller across attempts.
+        # fetch_range advances each range as it writes, so a retry only fetches what is left.
+        if not pending or not os.path.exists(local_filepath):
+            segments = self._plan_segments(uri, hostname, size)
+            if not segments:
+                return False
+
+            preallocate_file(local_filepath, segments[-1][1])
+            pending[:] = segments
+
+        cancelled = threading.Event()
+        # Span tags live in the calling thread, so each segment thread is given them again
+        span_args = self.tracer.current_args()
+
+        def fetch_segment(segment):
+            with self.tracer.span("segment", **span_args):
+                fetch_range(self, uri, local_filepath, segment, cancelled)
+
+        self.logger.debug("Downloading %s in %s segments", uri, len(pending))
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                futures = [
+                    executor.submit(fetch_segment, segment) for segment in pending
+                ]
+
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    # The other segments stop right away and keep what they have so far
+                    cancelled.set()
+                    raise
+        finally:
+            pending[:] = [segment for segment in pending if segment[0] < segment[1]]
+
+        return True
+
+    def _verify_assembled_file(self, local_filepath, checksum):
+        # Segments arrive out of order, so they can only be hashed once the file is complete
+        if checksum:
+            return verify_file(local_filepath, checksum)
+
     def _handle_error(self, e, attempt, retries, filename, local_filepath):
         self.logger.debug(
-            f"(Attempt {attempt} of {retries}) - Error downloading file {filename}: {e}"
+            "(Attempt %s of %s) - Error downloading file %s: %s",
+            attempt,
+            retries,
+            filename,
+            e,
         )
 
         if attempt == retries:
             self.logger.error(
-                f"Failed to download '{filename}' after {retries} attempts: {e}"
+                "Failed to download '%s' after %s attempts: %s", filename, retries, e
             )
-            self._cleanup_file(local_filepath)
+            self.cleanup_file(local_filepath)
             raise e
 
-    def _get_local_filepath(self, uri, dest_dir):
+    def get_local_filepath(self, uri, dest_dir):
         key = f"{uri}|{dest_dir}"
+        entry = self.manifest.get(key)
 
-        if key in self.downloaded_files:
-            return self.downloaded_files[key]
+        if entry is not None:
+            return entry["path"] if isinstance(entry, dict) else entry
 
         filename = os.path.basename(uri)
         filepath = os.path.join(dest_dir, filename)
@@ -1,63 +1,177 @@
 import os
 import ftplib
-from downloader.helper import save_downloaded_files
+from contextlib import contextmanager
+from downloader.integrity import ChecksumMismatchError, check_hasher, new_hasher
 from downloader.protocols.base_handler import BaseHandler
 
 
 class FTPHandler(BaseHandler):
     DEFAULT_PORT = 21
+    DEFAULT_CHUNK_SIZE = 8192
+    DEFAULT_TIMEOUT = 30
 
-    def __init__(self, stop_event):
-        super().__init__(__class__.__name__, stop_event)
+    def __init__(
+        self,
+        stop_event,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        timeout=DEFAULT_TIMEOUT,
+        tracer=None,
+        segments=1,
+        host_segments=None,
+        manifest=None,
+    ):
+        super().__init__(
+            __class__.__name__,
+            stop_event,
+            tracer,
+            segments,
+            host_segments,
+            manifest=manifest,
+        )
+        self.chunk_size = chunk_size
+        self.timeout = timeout
 
-    def download_file(self, uri, dest_dir, retries):
-        if not self._ensure_directory(dest_dir):
+    def download_file(self, uri, dest_dir, retries, checksum=None, size=None):
+        if not self.ensure_directory(dest_dir):
             return
 
         filename = os.path.basename(uri)
-        local_filepath = self._get_local_filepath(uri, dest_dir)
+        local_filepath = self.get_local_filepath(uri, dest_dir)
+
+        if self.is_verified(uri, dest_dir, checksum):
+            self.logger.info(
+                "'%s' in '%s' already matches its checksum, skipping",
+                filename,
+                dest_dir,
+            )
+            return local_filepath
 
         hostname, port, username, password, remote_path = self._parse_uri(
             uri, self.DEFAULT_PORT
         )
 
+        # Ranges of a segmented download still missing, kept so retries resume them
+        pending_segments = []
+
         for attempt in range(1, retries + 1):
             try:
-                self._attempt_download(
-                    hostname, port, username, password, remote_path, local_filepath
-                )
-                self.logger.info(f"Successfully downloaded {filename} to {dest_dir}")
-
-                # Saving downloaded filepath to manage name collisions
-                key = f"{uri}|{dest_dir}"
-                self.downloaded_files[key] = local_filepath
-                save_downloaded_files(self.downloaded_files)
-                return
-            except ftplib.all_errors as e:
+                with self.tracer.span(
+                    "attempt", host=hostname, file=filename, attempt=attempt
+                ):
+                    if self._attempt_segmented_download(
+                        uri, hostname, local_filepath, pending_segments, size
+                    ):
+                        digest = self._verify_assembled_file(local_filepath, checksum)
+                    else:
+                        digest = self._attempt_download(
+                            hostname,
+                            port,
+                            username,
+                            password,
+                            remote_path,
+                            local_filepath,
+                            checksum,
+                        )
+                self.logger.info("Successfully downloaded %s to %s", filename, dest_dir)
+
+                self.record_download(uri, dest_dir, local_filepath, digest)
+                return local_filepath
+            except ftplib.all_errors + (ChecksumMismatchError,) as e:
                 self._handle_error(e, attempt, retries, filename, local_filepath)
             except KeyboardInterrupt as e:
-                self.logger.error(f"Failed to download {filename}: {e}")
-                self._cleanup_file(local_filepath)
+                self.logger.error("Failed to download %s: %s", filename, e)
+                self.cleanup_file(local_filepath)
                 return
             except Exception as e:
-                self.logger.error(f"Unexpected error: {e}")
-                self._cleanup_file(local_filepath)
+                self.logger.error("Unexpected error: %s", e)
+                self.cleanup_file(local_filepath)
                 return
 
+    def get_file_size(self, uri):
+        hostname, port, username, password, remote_path = self._parse_uri(
+            uri, self.DEFAULT_PORT
+        )
+
+        with self._connect(hostname, port, username, password) as ftp:
+            # SIZE is only meaningful in binary mode
+            ftp.voidcmd("TYPE I")
+            return ftp.size(remote_path)
+
+    def read_range(self, uri, start, end, callback):
+        hostname, port, username, password, remote_path = self._parse_uri(
+            uri, self.DEFAULT_PORT
+        )
+        remaining = end - start
+
+        with self.tracer.span(
+            "range", host=hostname, range_start=start, range_end=end
+        ), self._connect(hostname, port, username, password) as ftp:
+            ftp.voidcmd("TYPE I")
+
+            try:
+                with ftp.transfercmd(f"RETR {remote_path}", rest=start or None) as conn:
+                    while remaining > 0:
+                        if self.stop_requested.is_set():
+                            raise KeyboardInterrupt("Download interrupted.")
+
+                        data = conn.recv(min(self.chunk_size, remaining))
+                        if not data:
+                            break
+
+                        callback(data)
+                        remaining -= len(data)
+            finally:
+                # The server may still be sending past the end of the range, so abort the transfer
+                # and drop the control connection instead of waiting for a clean QUIT
+                try:
+                    ftp.abort()
+                except ftplib.all_errors:
+                    pass
+                ftp.close()
+
+        if remaining > 0:
+            raise EOFError(
+                f"Connection closed with {remaining} bytes left in range of {uri}"
+            )
+
+    @contextmanager
+    def _connect(self, hostname, port, username, password):
+        self._trace_dns(hostname, port)
+
+        with ftplib.FTP(timeout=self.timeout) as ftp:
+            with self.tracer.span("connect"):
+                ftp.connect(hostname, port)
+
+            with self.tracer.span("login"):
+                ftp.login(username, password)
+
+            self.logger.info("Connected to FTP server at %s", hostname)
+
+            yield ftp
+
     def _attempt_download(
-        self, hostname, port, username, password, remote_path, local_filepath
+        self,
+        hostname,
+        port,
+        username,
+        password,
+        remote_path,
+        local_filepath,
+        checksum=None,
     ):
-        with ftplib.FTP() as ftp:
-            ftp.connect(hostname, port)
-            ftp.login(username, password)
-
-            self.logger.info(f"Connected to FTP server at {hostname}")
+        with self._connect(hostname, port, username, password) as ftp:
+            hasher = new_hasher(checksum)
 
-            with open(local_filepath, "wb") as f:
+            with open(local_filepath, "wb") as f, self.tracer.span(
+                "transfer"
+            ) as span_args:
+                write = self._make_writer(f, span_args, hasher)
 
                 def callback(data):
                     if self.stop_requested.is_set():
                         raise KeyboardInterrupt("Download interrupted.")
-                    f.write(data)
+                    write(data)
 
                 ftp.retrbinary(f"RETR {remote_path}", callback)
+
+        return check_hasher(hasher, checksum, os.path.basename(local_filepath))
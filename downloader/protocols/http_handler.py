@@ -1,6 +1,12 @@
 import os
 import requests
-from downloader.helper import save_downloaded_files
+from urllib.parse import urlparse
+from downloader.integrity import (
+    ChecksumMismatchError,
+    check_hasher,
+    checksum_from_headers,
+    new_hasher,
+)
 from downloader.protocols.base_handler import BaseHandler
 
 
@@ -15,52 +21,129 @@ class HTTPHandler(BaseHandler):
         chunk_size=DEFAULT_CHUNK_SIZE,
         timeout=DEFAULT_TIMEOUT,
         user_agent=DEFAULT_USER_AGENT,
+        tracer=None,
+        manifest=None,
     ):
-        super().__init__(__class__.__name__, stop_event)
+        super().__init__(__class__.__name__, stop_event, tracer, manifest=manifest)
         self.chunk_size = chunk_size
         self.timeout = timeout
         self.user_agent = user_agent
 
-    def download_file(self, uri, dest_dir, retries):
-        if not self._ensure_directory(dest_dir):
+    def download_file(self, uri, dest_dir, retries, checksum=None, size=None):
+        # size is only used for segmenting, which HTTP downloads do not do
+        if not self.ensure_directory(dest_dir):
             return
 
         filename = os.path.basename(uri)
-        local_filepath = self._get_local_filepath(uri, dest_dir)
+        local_filepath = self.get_local_filepath(uri, dest_dir)
+        hostname = urlparse(uri).hostname
+
+        if self.is_verified(uri, dest_dir, checksum):
+            self.logger.info(
+                "'%s' in '%s' already matches its checksum, skipping",
+                filename,
+                dest_dir,
+            )
+            return local_filepath
 
         for attempt in range(1, retries + 1):
             try:
-                self._attempt_download(uri, local_filepath)
+                with self.tracer.span(
+                    "attempt", host=hostname, file=filename, attempt=attempt
+                ):
+                    digest = self._attempt_download(uri, local_filepath, checksum)
                 self.logger.info(
-                    f"Successfully downloaded '{filename}' to '{dest_dir}'"
+                    "Successfully downloaded '%s' to '%s'", filename, dest_dir
                 )
 
-                # Saving downloaded filepath to manage name collisions
-                key = f"{uri}|{dest_dir}"
-                self.downloaded_files[key] = local_filepath
-                save_downloaded_files(self.downloaded_files)
-                return
-            except (requests.RequestException, OSError) as e:
+                self.record_download(uri, dest_dir, local_filepath, digest)
+                return local_filepath
+            except (requests.RequestException, OSError, ChecksumMismatchError) as e:
                 self._handle_error(e, attempt, retries, filename, local_filepath)
             except KeyboardInterrupt as e:
-                self.logger.error(f"Failed to download {filename}: {e}")
-                self._cleanup_file(local_filepath)
+                self.logger.error("Failed to download %s: %s", filename, e)
+                self.cleanup_file(local_filepath)
                 return
             except Exception as e:
-                self.logger.error(f"Unexpected error: {e}")
-                self._cleanup_file(local_filepath)
+                self.logger.error("Unexpected error: %s", e)
+                self.cleanup_file(local_filepath)
                 return
 
-    def _attempt_download(self, uri, filepath):
+    def _attempt_download(self, uri, filepath, checksum=None):
         # To avoid web servers from blocking our access, User-Agent helps identify this script as a legitimate tool
         headers = {"User-Agent": self.user_agent}
 
-        response = requests.get(uri, headers=headers, stream=True, timeout=self.timeout)
-        response.raise_for_status()
+        parsed_uri = urlparse(uri)
+        self._trace_dns(
+            parsed_uri.hostname,
+            parsed_uri.port or (443 if parsed_uri.scheme == "https" else 80),
+        )
+
+        # requests has no hooks between connecting and receiving the headers, so TCP connect,
+        # TLS handshake and time to first byte all fall in this span
+        with self.tracer.span("request"):
+            response = requests.get(
+                uri, headers=headers, stream=True, timeout=self.timeout
+            )
+            response.raise_for_status()
+
+        checksum = checksum or checksum_from_headers(response.headers)
+        hasher = new_hasher(checksum)
+
+        with open(filepath, "wb") as f, self.tracer.span("transfer") as span_args:
+            # The first byte arrived with the headers inside the request span, so a ttfb span
+            # measured from here would only show the gap to the first body chunk
+            write = self._make_writer(f, span_args, hasher, ttfb=False)
 
-        with open(filepath, "wb") as f:
             for chunk in response.iter_content(chunk_size=self.chunk_size):
                 if self.stop_requested.is_set():
                     raise KeyboardInterrupt("Download interrupted.")
 
-                f.write(chunk)
+                write(chunk)
+
+        return check_hasher(hasher, checksum, os.path.basename(filepath))
+
+    def get_file_size(self, uri):
+        headers = {"User-Agent": self.user_agent}
+
+        response = requests.head(
+            uri, headers=headers, allow_redirects=True, timeout=self.timeout
+        )
+        response.raise_for_status()
+
+        content_length = response.headers.get("Content-Length")
+        return int(content_length) if content_length is not None else None
+
+    def read_range(self, uri, start, end, callback):
+        headers = {"User-Agent": self.user_agent, "Range": f"bytes={start}-{end - 1}"}
+        remaining = end - start
+
+        with self.tracer.span(
+            "range", host=urlparse(uri).hostname, range_start=start, range_end=end
+        ):
+            with requests.get(
+                uri, headers=headers, stream=True, timeout=self.timeout
+            ) as response:
+                response.raise_for_status()
+
+                # A server that ignores the Range header sends the whole body, which is only usable from offset 0
+                if response.status_code != 206 and start > 0:
+                    raise requests.RequestException(
+                        f"Server does not support range requests for {uri}"
+                    )
+
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if self.stop_requested.is_set():
+                        raise KeyboardInterrupt("Download interrupted.")
+
+                    chunk = chunk[:remaining]
+                    callback(chunk)
+                    remaining -= len(chunk)
+
+                    if remaining <= 0:
+                        break
+
+            if remaining > 0:
+                raise requests.RequestException(
+                    f"Connection closed with {remaining} bytes left in range of {uri}"
+                )
@@ -1,76 +1,199 @@
 import os
+import socket
 import paramiko
-from downloader.helper import save_downloaded_files
+from contextlib import contextmanager
+from downloader.integrity import ChecksumMismatchError, check_hasher, new_hasher
 from downloader.protocols.base_handler import BaseHandler
 
 
 class SFTPHandler(BaseHandler):
     DEFAULT_PORT = 22
+    DEFAULT_CHUNK_SIZE = 32768
+    DEFAULT_TIMEOUT = 30
+    MAX_CONCURRENT_REQUESTS = 64
 
-    def __init__(self, stop_event, use_key=False, key_path=None):
-        super().__init__(__class__.__name__, stop_event)
+    def __init__(
+        self,
+        stop_event,
+        use_key=False,
+        key_path=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        timeout=DEFAULT_TIMEOUT,
+        tracer=None,
+        segments=1,
+        host_segments=None,
+        manifest=None,
+    ):
+        super().__init__(
+            __class__.__name__,
+            stop_event,
+            tracer,
+            segments,
+            host_segments,
+            manifest=manifest,
+        )
         self.use_key = use_key
         self.key_path = key_path
+        self.chunk_size = chunk_size
+        self.timeout = timeout
 
-    def download_file(self, uri, dest_dir, retries):
-        if not self._ensure_directory(dest_dir):
+    def download_file(self, uri, dest_dir, retries, checksum=None, size=None):
+        if not self.ensure_directory(dest_dir):
             return
 
         filename = os.path.basename(uri)
-        local_filepath = self._get_local_filepath(uri, dest_dir)
+        local_filepath = self.get_local_filepath(uri, dest_dir)
+
+        if self.is_verified(uri, dest_dir, checksum):
+            self.logger.info(
+                "'%s' in '%s' already matches its checksum, skipping",
+                filename,
+                dest_dir,
+            )
+            return local_filepath
 
         hostname, port, username, password, remote_path = self._parse_uri(
             uri, self.DEFAULT_PORT
         )
 
+        # Ranges of a segmented download still missing, kept so retries resume them
+        pending_segments = []
+
         for attempt in range(1, retries + 1):
             try:
-                self._attempt_download(
-                    hostname, port, username, password, remote_path, local_filepath
-                )
+                with self.tracer.span(
+                    "attempt", host=hostname, file=filename, attempt=attempt
+                ):
+                    if self._attempt_segmented_download(
+                        uri, hostname, local_filepath, pending_segments, size
+                    ):
+                        digest = self._verify_assembled_file(local_filepath, checksum)
+                    else:
+                        digest = self._attempt_download(
+                            hostname,
+                            port,
+                            username,
+                            password,
+                            remote_path,
+                            local_filepath,
+                            checksum,
+                        )
                 self.logger.info(
-                    f"Successfully downloaded '{filename}' to '{dest_dir}'"
+                    "Successfully downloaded '%s' to '%s'", filename, dest_dir
                 )
 
-                # Saving downloaded filepath to manage name collisions
-                key = f"{uri}|{dest_dir}"
-                self.downloaded_files[key] = local_filepath
-                save_downloaded_files(self.downloaded_files)
-                return
-            except paramiko.SSHException as e:
+                self.record_download(uri, dest_dir, local_filepath, digest)
+                return local_filepath
+            except (
+                paramiko.SSHException,
+                OSError,
+                EOFError,
+                ChecksumMismatchError,
+            ) as e:
                 self._handle_error(e, attempt, retries, filename, local_filepath)
             except KeyboardInterrupt as e:
-                self.logger.error(f"Failed to download {filename}: {e}")
-                self._cleanup_file(local_filepath)
+                self.logger.error("Failed to download %s: %s", filename, e)
+                self.cleanup_file(local_filepath)
                 return
             except Exception as e:
-                self.logger.error(f"Unexpected error: {e}")
-                self._cleanup_file(local_filepath)
+                self.logger.error("Unexpected error: %s", e)
+                self.cleanup_file(local_filepath)
                 return
 
+    def get_file_size(self, uri):
+        hostname, port, username, password, remote_path = self._parse_uri(
+            uri, self.DEFAULT_PORT
+        )
+
+        with self._open_sftp(hostname, port, username, password) as sftp:
+            return sftp.stat(remote_path).st_size
+
+    def read_range(self, uri, start, end, callback):
+        hostname, port, username, password, remote_path = self._parse_uri(
+            uri, self.DEFAULT_PORT
+        )
+
+        with self.tracer.span(
+            "range", host=hostname, range_start=start, range_end=end
+        ), self._open_sftp(hostname, port, username, password) as sftp:
+            sftp.get_channel().settimeout(self.timeout)
+
+            with sftp.open(remote_path, "rb") as remote_file:
+                chunks = [
+                    (offset, min(self.chunk_size, end - offset))
+                    for offset in range(start, end, self.chunk_size)
+                ]
+
+                # readv pipelines the reads instead of waiting for a round trip per chunk
+                for data in remote_file.readv(chunks, self.MAX_CONCURRENT_REQUESTS):
+                    if self.stop_requested.is_set():
+                        raise KeyboardInterrupt("Download interrupted.")
+
+                    if not data:
+                        raise EOFError(f"Unexpected end of file in range of {uri}")
+
+                    callback(data)
+
+    @contextmanager
+    def _open_sftp(self, hostname, port, username, password):
+        self._trace_dns(hostname, port)
+
+        with self.tracer.span("connect"):
+            sock = socket.create_connection((hostname, port), timeout=self.timeout)
+
+        # Driving the transport directly instead of through SSHClient.connect lets the SSH
+        # handshake and authentication be timed separately. As with the AutoAddPolicy this
+        # replaces, the server's host key is accepted without a known_hosts check.
+        with sock, paramiko.Transport(sock) as transport:
+            with self.tracer.span("handshake"):
+                transport.start_client(timeout=self.timeout)
+
+            with self.tracer.span("auth"):
+                if self.use_key and self.key_path:
+                    key = paramiko.RSAKey.from_private_key_file(self.key_path)
+                    transport.auth_publickey(username, key)
+                else:
+                    transport.auth_password(username, password)
+
+            open_start = self.tracer.now()
+
+            with paramiko.SFTPClient.from_transport(transport) as sftp:
+                self.tracer.add_span("open_sftp", open_start, self.tracer.now())
+                yield sftp
+
     def _attempt_download(
-        self, hostname, port, username, password, remote_path, local_filepath
+        self,
+        hostname,
+        port,
+        username,
+        password,
+        remote_path,
+        local_filepath,
+        checksum=None,
     ):
-        with paramiko.SSHClient() as ssh:
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-            if self.use_key and self.key_path:
-                key = paramiko.RSAKey.from_private_key_file(self.key_path)
-                ssh.connect(hostname, port, username, pkey=key, look_for_keys=False)
-            else:
-                ssh.connect(
-                    hostname,
-                    port,
-                    username,
-                    password,
-                    look_for_keys=False,
-                    allow_agent=False,
-                )
+        hasher = new_hasher(checksum)
 
-            with ssh.open_sftp() as sftp:
+        with self._open_sftp(hostname, port, username, password) as sftp:
+            file_size = sftp.stat(remote_path).st_size
 
-                def callback(transferred, total):
+            # Pipelined like sftp.get, but the write loop is ours so the data can be hashed on the way
+            with sftp.open(remote_path, "rb") as remote_file, open(
+                local_filepath, "wb"
+            ) as f, self.tracer.span("transfer") as span_args:
+                remote_file.prefetch(file_size, self.MAX_CONCURRENT_REQUESTS)
+                write = self._make_writer(f, span_args, hasher)
+                received = 0
+
+                for data in iter(lambda: remote_file.read(self.chunk_size), b""):
                     if self.stop_requested.is_set():
                         raise KeyboardInterrupt("Download interrupted.")
 
-                sftp.get(remote_path, local_filepath, callback)
+                    write(data)
+                    received += len(data)
+
+            if received != file_size:
+                raise EOFError(
+                    f"Expected {file_size} bytes from {remote_path}, got {received}"
+                )
+
+        return check_hasher(hasher, checksum, os.path.basename(local_filepath))
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+class Tracer:
+    enabled = True
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.events = []
+        self.thread_names = {}
+        self.local = threading.local()
+
+    def now(self):
+        # Chrome trace timestamps are microseconds
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def current_args(self):
+        # Tags of the spans open in this thread, for handing on to work done in other threads
+        return dict(getattr(self.local, "args", {}))
+
+    @contextmanager
+    def span(self, name, **args):
+        # Spans nested in the same thread inherit the args of their parents, so tags such as
+        # host and attempt only need to be given once per attempt
+        parent_args = getattr(self.local, "args", {})
+        span_args = {**parent_args, **args}
+        self.local.args = span_args
+        # Measurements filled in by the caller while the span is open
+        results = {}
+        start = self.now()
+
+        try:
+            yield results
+        except BaseException as e:
+            results["error"] = repr(e)
+            raise
+        finally:
+            self.local.args = parent_args
+            self.add_span(name, start, self.now(), **{**span_args, **results})
+
+    def add_span(self, name, start, end, **args):
+        thread = threading.current_thread()
+        self.thread_names[thread.ident] = thread.name
+
+        # list.append is atomic, so recording spans never blocks other download threads
+        self.events.append(
+            {
+                "name": name,
+                "cat": "download",
+                "ph": "X",
+                "ts": start,
+                "dur": end - start,
+                "pid": self.pid,
+                "tid": thread.ident,
+                "args": {**getattr(self.local, "args", {}), **args},
+            }
+        )
+
+    def export(self, path):
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self.pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self.thread_names.items()
+        ]
+
+        with open(path, "w") as file:
+            json.dump(
+                {"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, file
+            )
+
+
+class NullTracer:
+    enabled = False
+
+    def __init__(self):
+        self.null_span = nullcontext({})
+
+    def now(self):
+        return 0
+
+    def current_args(self):
+        return {}
+
+    def span(self, name, **args):
+        return self.null_span
+
+    def add_span(self, name, start, end, **args):
+        pass
+
+    def export(self, path):
+        pass
+
+
+NULL_TRACER = NullTracer()
@@ -1,19 +1,31 @@
+import queue
 import argparse
 import logging
+from logging.handlers import QueueListener
 from downloader.download_manager import Downloader
+from downloader.tracing import Tracer
+from downloader.log_utils import (
+    DeferredQueueHandler,
+    JsonLinesFormatter,
+    RateLimitFilter,
+)
 
 
-def setup_logging():
+def setup_logging(log_format="text"):
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
 
+    if log_format == "json":
+        file_formatter = JsonLinesFormatter()
+    else:
+        file_formatter = logging.Formatter(
+            "%(asctime)s [%(threadName)s] %(levelname)s: %(message)s"
+        )
+
     # Output retry logs to a debug_log file to avoid cluttering the console
     file_handler = logging.FileHandler("debug_logs.log")
     file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(
-        logging.Formatter("%(asctime)s [%(threadName)s] %(levelname)s: %(message)s")
-    )
-    logger.addHandler(file_handler)
+    file_handler.setFormatter(file_formatter)
 
     # Create a console handler for outputting logs to the console
     console_handler = logging.StreamHandler()
@@ -21,14 +33,43 @@ def setup_logging():
     console_handler.setFormatter(
         logging.Formatter("[%(threadName)s] %(levelname)s: %(message)s")
     )
-    logger.addHandler(console_handler)
 
+    # Download threads only enqueue records, formatting and I/O happen on the listener thread
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    listener.start()
+    return listener
 
-def main():
-    setup_logging()
 
+def main():
     parser = argparse.ArgumentParser(description="Download files from provided URIs")
-    parser.add_argument("uris", nargs="+", help="Lost of uris to download")
+    parser.add_argument("uris", nargs="*", help="Lost of uris to download")
+    parser.add_argument(
+        "--mirror",
+        nargs="+",
+        action="append",
+        default=[],
+        metavar="URI",
+        help="Mirror uris serving the same file, downloaded as a single file (repeatable)",
+    )
+    parser.add_argument(
+        "--checksum",
+        action="append",
+        default=[],
+        metavar="URI=ALGORITHM:HEXDIGEST",
+        help="Expected checksum of a file, keyed by its uri or the first uri of a mirror group (repeatable)",
+    )
+    parser.add_argument(
+        "--sidecar-checksums",
+        action="store_true",
+        help="Look up a '<uri>.sha256' file for downloads without a --checksum",
+    )
     parser.add_argument(
         "--dest",
         type=str,
@@ -41,14 +82,97 @@ def main():
         default=3,
         help="Number of retry attempts for each failed download",
     )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=1,
+        help="Number of parallel connections used for each large FTP/SFTP file",
+    )
+    parser.add_argument(
+        "--host-segments",
+        action="append",
+        default=[],
+        metavar="HOST=N",
+        help="Override --segments for one FTP/SFTP host (repeatable)",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        help="Number of files downloaded at the same time, defaults to all of them",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Probe file sizes and free space, print the download plan and exit",
+    )
+    parser.add_argument(
+        "--no-plan",
+        action="store_true",
+        help="Skip probing file sizes and download in the order given",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=["text", "json"],
+        default="text",
+        help="Format of the debug_logs.log file, json writes one JSON object per line",
+    )
+
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Record the phases of every transfer and write them to PATH in Chrome trace format",
+    )
 
     args = parser.parse_args()
 
+    if not args.uris and not args.mirror:
+        parser.error("at least one uri or --mirror group is required")
+
+    checksums = {}
+    for checksum in args.checksum:
+        uri, separator, digest = checksum.rpartition("=")
+        if not separator:
+            parser.error(
+                f"invalid --checksum '{checksum}', expected URI=ALGORITHM:HEXDIGEST"
+            )
+        checksums[uri] = digest
+
+    host_segments = {}
+    for host_segment in args.host_segments:
+        host, separator, segments = host_segment.rpartition("=")
+        if not separator or not segments.isdigit():
+            parser.error(f"invalid --host-segments '{host_segment}', expected HOST=N")
+        host_segments[host] = int(segments)
+
+    listener = setup_logging(args.log_format)
+    tracer = Tracer() if args.trace else None
+
     try:
-        downloader = Downloader(args.uris, args.dest, args.retries)
-        downloader.download_files()
+        downloader = Downloader(
+            args.uris + args.mirror,
+            args.dest,
+            args.retries,
+            max_workers=args.max_workers,
+            checksums=checksums,
+            tracer=tracer,
+            plan=not args.no_plan,
+            segments=args.segments,
+            host_segments=host_segments,
+            sidecar_checksums=args.sidecar_checksums,
+        )
+
+        if args.dry_run:
+            print(downloader.plan().describe())
+        else:
+            downloader.download_files()
     except Exception as e:
-        logging.exception(f"An error occurred during file downloads: {e}")
+        logging.exception("An error occurred during file downloads: %s", e)
+    finally:
+        if tracer:
+            tracer.export(args.trace)
+
+        # Flushes whatever is still queued before the process exits
+        listener.stop()
 
 
 if __name__ == "__main__":
@@ -1,22 +1,33 @@
 import os
+import shutil
+import tempfile
 import threading
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+from concurrent.futures import ThreadPoolExecutor
+from downloader.helper import DownloadManifest, load_downloaded_files
 from downloader.protocols.base_handler import BaseHandler
+from downloader.tracing import Tracer
 
 
 class TestBaseHandler(unittest.TestCase):
     def setUp(self):
-        self.handler = BaseHandler("test_logger", threading.Event())
+        manifest_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, manifest_dir)
+        self.manifest = DownloadManifest(
+            os.path.join(manifest_dir, "downloaded_files.json")
+        )
+        self.handler = BaseHandler(
+            "test_logger", threading.Event(), manifest=self.manifest
+        )
         self.test_path = "/fake/dir"
         self.test_file = "/fake/dir/dummyFile.pdf"
-        self.handler.downloaded_files = {}
 
     @patch("os.makedirs")
     def test_ensure_directory_success(self, mock_makedirs):
         mock_makedirs.return_value = None
 
-        result = self.handler._ensure_directory(self.test_path)
+        result = self.handler.ensure_directory(self.test_path)
 
         self.assertTrue(result)
         mock_makedirs.assert_called_once_with(self.test_path, exist_ok=True)
@@ -24,12 +35,14 @@ class TestBaseHandler(unittest.TestCase):
     @patch("logging.Logger.error")
     @patch("os.makedirs", side_effect=OSError("Error creating directory"))
     def test_ensure_directory_failure(self, mock_makedirs, mock_error):
-        result = self.handler._ensure_directory(self.test_path)
+        result = self.handler.ensure_directory(self.test_path)
 
         mock_makedirs.assert_called_once_with(self.test_path, exist_ok=True)
         self.assertFalse(result)
         mock_error.assert_called_once_with(
-            f"Failed to create directory {self.test_path}: Error creating directory"
+            "Failed to create directory %s: %s",
+            self.test_path,
+            mock_makedirs.side_effect,
         )
 
     @patch("logging.Logger.info")
@@ -37,27 +50,29 @@ class TestBaseHandler(unittest.TestCase):
     def test_cleanup_file_exists(self, mock_remove, mock_info):
         mock_remove.return_value = None
 
-        self.handler._cleanup_file(self.test_file)
+        self.handler.cleanup_file(self.test_file)
 
         mock_remove.assert_called_once_with(self.test_file)
-        mock_info.assert_called_with(f"Removed partial download {self.test_file}")
+        mock_info.assert_called_with("Removed partial download %s", self.test_file)
 
     @patch("logging.Logger.warning")
     @patch("os.remove", side_effect=FileNotFoundError)
     def test_cleanup_file_not_exists(self, mock_remove, mock_warning):
-        self.handler._cleanup_file(self.test_file)
+        self.handler.cleanup_file(self.test_file)
 
         mock_remove.assert_called_once_with(self.test_file)
-        mock_warning.assert_called_with(f"No file to remove at {self.test_file}")
+        mock_warning.assert_called_with("No file to remove at %s", self.test_file)
 
     @patch("logging.Logger.error")
     @patch("os.remove", side_effect=OSError("Error removing file"))
     def test_cleanup_file_failure(self, mock_remove, mock_error):
-        self.handler._cleanup_file(self.test_file)
+        self.handler.cleanup_file(self.test_file)
 
         mock_remove.assert_called_once_with(self.test_file)
         mock_error.assert_called_with(
-            f"Failed to remove partial download {self.test_file}: Error removing file"
+            "Failed to remove partial download %s: %s",
+            self.test_file,
+            mock_remove.side_effect,
         )
 
     def test_parse_ftp_uri(self):
@@ -88,7 +103,7 @@ class TestBaseHandler(unittest.TestCase):
 
         self.assertEqual(result, expected_result)
 
-    @patch("downloader.protocols.base_handler.BaseHandler._cleanup_file")
+    @patch("downloader.protocols.base_handler.BaseHandler.cleanup_file")
     @patch("logging.Logger.debug")
     @patch("logging.Logger.error")
     def test_handle_error_last_attempt(self, mock_error, mock_debug, mock_cleanup):
@@ -101,14 +116,14 @@ class TestBaseHandler(unittest.TestCase):
 
         self.assertTrue("Download error" in str(context.exception))
         mock_debug.assert_called_with(
-            f"(Attempt 3 of 3) - Error downloading file {filename}: Download error"
+            "(Attempt %s of %s) - Error downloading file %s: %s", 3, 3, filename, error
         )
         mock_error.assert_called_with(
-            f"Failed to download '{filename}' after 3 attempts: Download error"
+            "Failed to download '%s' after %s attempts: %s", filename, 3, error
         )
         mock_cleanup.assert_called_once_with(filepath)
 
-    @patch("downloader.protocols.base_handler.BaseHandler._cleanup_file")
+    @patch("downloader.protocols.base_handler.BaseHandler.cleanup_file")
     @patch("logging.Logger.debug")
     @patch("logging.Logger.error")
     def test_handle_error_not_last_attempt(self, mock_error, mock_debug, mock_cleanup):
@@ -119,16 +134,16 @@ class TestBaseHandler(unittest.TestCase):
         self.handler._handle_error(error, 1, 3, filename, filepath)
 
         mock_debug.assert_called_once_with(
-            f"(Attempt 1 of 3) - Error downloading file {filename}: Download error"
+            "(Attempt %s of %s) - Error downloading file %s: %s", 1, 3, filename, error
         )
         mock_error.assert_not_called()
         mock_cleanup.assert_not_called()
 
     def test_existing_key_in_downloaded_files(self):
         filepath = "/fake/dir/dummyFile.pdf"
-        self.handler.downloaded_files["uri|dest_dir"] = filepath
+        self.manifest.entries["uri|dest_dir"] = filepath
 
-        result = self.handler._get_local_filepath("uri", "dest_dir")
+        result = self.handler.get_local_filepath("uri", "dest_dir")
 
         self.assertEqual(result, filepath)
 
@@ -137,18 +152,192 @@ class TestBaseHandler(unittest.TestCase):
         mock_exists.return_value = False
         expected = os.path.join("dest_dir", "uri")
 
-        result = self.handler._get_local_filepath("uri", "dest_dir")
+        result = self.handler.get_local_filepath("uri", "dest_dir")
 
         self.assertEqual(result, expected)
 
     @patch("os.path.exists", side_effect=[True, True, False])
     def test_filepath_already_exist(self, mock_exists):
-        result = self.handler._get_local_filepath(
+        result = self.handler.get_local_filepath(
             "http://example.com/dummyFile.pdf", "dest_dir"
         )
 
         self.assertEqual(result, "dest_dir/dummyFile_2.pdf")
 
+    def test_segmented_download_writes_each_range_at_its_offset(self):
+        data = os.urandom(1000)
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        filepath = os.path.join(tmp_dir, "dummyFile.pdf")
+
+        self.handler.segments = 4
+        self.handler.min_segment_size = 100
+        self.handler.get_file_size = MagicMock(return_value=len(data))
+        self.handler.read_range = MagicMock(
+            side_effect=lambda uri, start, end, callback: callback(data[start:end])
+        )
+
+        result = self.handler._attempt_segmented_download(
+            "ftp://hostname/dummyFile.pdf", "hostname", filepath, []
+        )
+
+        self.assertTrue(result)
+        ranges = sorted(call.args[1:3] for call in self.handler.read_range.mock_calls)
+        self.assertEqual(ranges, [(0, 250), (250, 500), (500, 750), (750, 1000)])
+        with open(filepath, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_segmented_retry_only_fetches_missing_ranges(self):
+        data = os.urandom(1000)
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        filepath = os.path.join(tmp_dir, "dummyFile.pdf")
+        failed = []
+
+        def read_range(uri, start, end, callback):
+            if start == 500 and not failed:
+                failed.append(start)
+                callback(data[500:600])
+                raise EOFError("Connection closed")
+            callback(data[start:end])
+
+        self.handler.segments = 4
+        self.handler.min_segment_size = 100
+        self.handler.get_file_size = MagicMock(return_value=len(data))
+        self.handler.read_range = MagicMock(side_effect=read_range)
+        pending = []
+
+        with self.assertRaises(EOFError):
+            self.handler._attempt_segmented_download(
+                "ftp://hostname/dummyFile.pdf", "hostname", filepath, pending
+            )
+        self.assertIn([600, 750], pending)
+        self.handler.read_range.reset_mock()
+
+        result = self.handler._attempt_segmented_download(
+            "ftp://hostname/dummyFile.pdf", "hostname", filepath, pending
+        )
+
+        self.assertTrue(result)
+        self.assertEqual(pending, [])
+        self.handler.get_file_size.assert_called_once()
+        ranges = [call.args[1:3] for call in self.handler.read_range.mock_calls]
+        self.assertIn((600, 750), ranges)
+        self.assertNotIn((500, 750), ranges)
+        with open(filepath, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_segment_spans_keep_the_attempt_tags(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        tracer = Tracer()
+        self.handler.tracer = tracer
+        self.handler.segments = 2
+        self.handler.min_segment_size = 100
+        self.handler.get_file_size = MagicMock(return_value=200)
+
+        def read_range(uri, start, end, callback):
+            tracer.add_span("range", tracer.now(), tracer.now())
+            callback(b"x" * (end - start))
+
+        self.handler.read_range = MagicMock(side_effect=read_range)
+
+        with tracer.span("attempt", host="hostname", file="dummyFile.pdf", attempt=2):
+            self.handler._attempt_segmented_download(
+                "ftp://hostname/dummyFile.pdf",
+                "hostname",
+                os.path.join(tmp_dir, "dummyFile.pdf"),
+                [],
+            )
+
+        spans = [event for event in tracer.events if event["name"] != "attempt"]
+        self.assertEqual(
+            sorted(event["name"] for event in spans),
+            ["range", "range", "segment", "segment"],
+        )
+        for event in spans:
+            self.assertEqual(event["args"]["attempt"], 2)
+            self.assertEqual(event["args"]["file"], "dummyFile.pdf")
+
+    def test_segmented_download_uses_host_override(self):
+        self.handler.segments = 4
+        self.handler.host_segments = {"hostname": 1}
+        self.handler.get_file_size = MagicMock()
+
+        result = self.handler._attempt_segmented_download(
+            "ftp://hostname/dummyFile.pdf", "hostname", self.test_file, []
+        )
+
+        self.assertFalse(result)
+        self.handler.get_file_size.assert_not_called()
+
+    def test_known_size_is_not_probed_again(self):
+        self.handler.segments = 4
+        self.handler.min_segment_size = 100
+        self.handler.get_file_size = MagicMock()
+
+        segments = self.handler._plan_segments(
+            "ftp://hostname/dummyFile.pdf", "hostname", 400
+        )
+
+        self.assertEqual(segments, [[0, 100], [100, 200], [200, 300], [300, 400]])
+        self.handler.get_file_size.assert_not_called()
+
+    def test_small_file_is_not_segmented(self):
+        self.handler.segments = 4
+        self.handler.min_segment_size = 100
+        self.handler.get_file_size = MagicMock(return_value=150)
+
+        result = self.handler._attempt_segmented_download(
+            "ftp://hostname/dummyFile.pdf", "hostname", self.test_file, []
+        )
+
+        self.assertFalse(result)
+
+    def test_verified_download_is_recognised_until_file_changes(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        uri = "ftp://hostname/dummyFile.pdf"
+        filepath = os.path.join(tmp_dir, "dummyFile.pdf")
+        checksum = "sha256:" + "a" * 64
+
+        with open(filepath, "wb") as f:
+            f.write(b"data")
+
+        self.handler.record_download(uri, tmp_dir, filepath, checksum)
+
+        self.assertEqual(
+            load_downloaded_files(self.manifest.path)[f"{uri}|{tmp_dir}"]["digest"],
+            checksum,
+        )
+        self.assertEqual(self.handler.get_local_filepath(uri, tmp_dir), filepath)
+        self.assertTrue(self.handler.is_verified(uri, tmp_dir, "a" * 64))
+        self.assertFalse(self.handler.is_verified(uri, tmp_dir, "sha256:" + "b" * 64))
+        self.assertFalse(self.handler.is_verified(uri, tmp_dir, None))
+
+        with open(filepath, "ab") as f:
+            f.write(b"more")
+
+        self.assertFalse(self.handler.is_verified(uri, tmp_dir, checksum))
+
+    def test_handlers_sharing_a_manifest_keep_each_others_entries(self):
+        other_handler = BaseHandler(
+            "other_logger", threading.Event(), manifest=self.manifest
+        )
+        keys = [f"ftp://hostname/{n}.pdf" for n in range(20)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for index, uri in enumerate(keys):
+                handler = self.handler if index % 2 else other_handler
+                executor.submit(
+                    handler.record_download, uri, self.test_path, f"/fake/dir/{index}"
+                )
+
+        saved = load_downloaded_files(self.manifest.path)
+        self.assertEqual(
+            sorted(saved), sorted(f"{uri}|{self.test_path}" for uri in keys)
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
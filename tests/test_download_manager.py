@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from downloader.download_manager import Downloader
+
+
+class TestDownloader(unittest.TestCase):
+    def test_unique_uris_drops_equivalent_duplicates(self):
+        downloader = Downloader(
+            [
+                "https://example.com/dummyFile.pdf",
+                "HTTPS://Example.com:443/dummyFile.pdf#page=2",
+                "https://example.com/dummyFile.pdf?version=2",
+            ],
+            "/fake/dir",
+            1,
+        )
+
+        self.assertEqual(
+            downloader._unique_uris(),
+            [
+                "https://example.com/dummyFile.pdf",
+                "https://example.com/dummyFile.pdf?version=2",
+            ],
+        )
+
+    def test_unique_uris_merges_mirror_groups(self):
+        downloader = Downloader(
+            [
+                "ftp://hostname/other.pdf",
+                ["ftp://hostname/other.pdf", "sftp://hostname/other.pdf"],
+                ["FTP://hostname/other.pdf", "https://example.com/other.pdf"],
+                ["https://example.com/dummyFile.pdf", "ftp://hostname/dummyFile.pdf"],
+                "https://example.com/dummyFile.pdf",
+            ],
+            "/fake/dir",
+            1,
+        )
+
+        self.assertEqual(
+            downloader._unique_uris(),
+            [
+                [
+                    "ftp://hostname/other.pdf",
+                    "sftp://hostname/other.pdf",
+                    "https://example.com/other.pdf",
+                ],
+                ["https://example.com/dummyFile.pdf", "ftp://hostname/dummyFile.pdf"],
+            ],
+        )
+
+    def test_handlers_share_one_manifest(self):
+        downloader = Downloader(["ftp://hostname/dummyFile.pdf"], "/fake/dir", 1)
+
+        manifests = {
+            id(handler.manifest) for handler in downloader.protocol_handlers.values()
+        }
+
+        self.assertEqual(manifests, {id(downloader.manifest)})
+
+    @patch("shutil.disk_usage")
+    def test_planned_size_is_passed_to_the_transfer(self, mock_disk_usage):
+        mock_disk_usage.return_value.free = 5000
+        uri = "ftp://hostname/dummyFile.pdf"
+        downloader = Downloader([uri], "/fake/dir", 1)
+        handler = MagicMock()
+        handler.get_file_size.return_value = 1000
+        handler.download_file.return_value = "/fake/dir/dummyFile.pdf"
+        downloader.protocol_handlers["ftp"] = handler
+
+        downloader.download_files()
+
+        handler.get_file_size.assert_called_once_with(uri)
+        handler.download_file.assert_called_once_with(uri, "/fake/dir", 1, None, 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
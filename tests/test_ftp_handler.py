@@ -18,7 +18,7 @@ class TestFTPHandler(unittest.TestCase):
     @patch("logging.Logger.info")
     @patch("ftplib.FTP")
     @patch("builtins.open", new_callable=mock_open)
-    @patch("downloader.protocols.ftp_handler.FTPHandler._ensure_directory")
+    @patch("downloader.protocols.ftp_handler.FTPHandler.ensure_directory")
     def test_successful_download(self, mock_ensure_dir, mock_open, mock_ftp, mock_info):
         mock_ensure_dir.return_value = True
         # Mock entering the with statment to start the FTP context
@@ -37,8 +37,8 @@ class TestFTPHandler(unittest.TestCase):
         mock_ftp_instance.login.assert_called_once_with("username", "password")
         mock_info.assert_has_calls(
             [
-                call("Connected to FTP server at hostname"),
-                call(f"Successfully downloaded {self.filename} to {self.dest_dir}"),
+                call("Connected to FTP server at %s", "hostname"),
+                call("Successfully downloaded %s to %s", self.filename, self.dest_dir),
             ],
             any_order=False,
         )
@@ -48,7 +48,7 @@ class TestFTPHandler(unittest.TestCase):
     @patch("logging.Logger.error")
     @patch("builtins.open", new_callable=mock_open)
     @patch("ftplib.FTP")
-    @patch("downloader.protocols.ftp_handler.FTPHandler._ensure_directory")
+    @patch("downloader.protocols.ftp_handler.FTPHandler.ensure_directory")
     def test_download_failure_and_retries(
         self, mock_ensure_dir, mock_ftp, mock_open, mock_error, mock_warning, mock_debug
     ):
@@ -67,21 +67,48 @@ class TestFTPHandler(unittest.TestCase):
         mock_debug.assert_has_calls(
             [
                 call(
-                    f"(Attempt 1 of 2) - Error downloading file {self.filename}: 550 Permission denied."
+                    "(Attempt %s of %s) - Error downloading file %s: %s",
+                    1,
+                    2,
+                    self.filename,
+                    mock_ftp_instance.retrbinary.side_effect,
                 ),
                 call(
-                    f"(Attempt 2 of 2) - Error downloading file {self.filename}: 550 Permission denied."
+                    "(Attempt %s of %s) - Error downloading file %s: %s",
+                    2,
+                    2,
+                    self.filename,
+                    mock_ftp_instance.retrbinary.side_effect,
                 ),
             ],
             any_order=False,
         )
         mock_error.assert_called_once_with(
-            f"Failed to download '{self.filename}' after {retries} attempts: 550 Permission denied."
+            "Failed to download '%s' after %s attempts: %s",
+            self.filename,
+            retries,
+            mock_ftp_instance.retrbinary.side_effect,
         )
         mock_warning.assert_called_once_with(
-            f"No file to remove at {self.dest_dir}/{self.filename}"
+            "No file to remove at %s", f"{self.dest_dir}/{self.filename}"
         )
 
+    @patch("ftplib.FTP")
+    def test_read_range_resumes_at_offset_and_aborts_at_end(self, mock_ftp):
+        mock_ftp_instance = mock_ftp.return_value.__enter__.return_value
+        mock_conn = mock_ftp_instance.transfercmd.return_value.__enter__.return_value
+        mock_conn.recv.side_effect = [b"0123", b"45"]
+        received = []
+
+        self.handler.read_range(self.uri, 100, 106, received.append)
+
+        mock_ftp_instance.transfercmd.assert_called_once_with(
+            "RETR /path/to/dummyFile.pdf", rest=100
+        )
+        self.assertEqual(received, [b"0123", b"45"])
+        mock_ftp_instance.abort.assert_called_once()
+        mock_ftp_instance.close.assert_called_once()
+
 
 if __name__ == "__main__":
     unittest.main()
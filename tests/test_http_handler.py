@@ -4,6 +4,7 @@ import unittest.mock
 import requests
 import threading
 from unittest.mock import ANY, MagicMock, call, patch
+from downloader.integrity import ChecksumMismatchError
 from downloader.protocols.http_handler import HTTPHandler
 
 
@@ -37,7 +38,7 @@ class TestHTTPHandler(unittest.TestCase):
         mock_open.assert_any_call(self.local_filepath, "wb")
         mock_open().write.assert_any_call(b"data")
         mock_info.assert_called_once_with(
-            f"Successfully downloaded '{self.filename}' to '{self.dest_dir}'"
+            "Successfully downloaded '%s' to '%s'", self.filename, self.dest_dir
         )
 
     @patch("logging.Logger.debug")
@@ -58,21 +59,79 @@ class TestHTTPHandler(unittest.TestCase):
         mock_debug.assert_has_calls(
             [
                 call(
-                    f"(Attempt 1 of 2) - Error downloading file {self.filename}: Error Not Found"
+                    "(Attempt %s of %s) - Error downloading file %s: %s",
+                    1,
+                    2,
+                    self.filename,
+                    mock_get.side_effect,
                 ),
                 call(
-                    f"(Attempt 2 of 2) - Error downloading file {self.filename}: Error Not Found"
+                    "(Attempt %s of %s) - Error downloading file %s: %s",
+                    2,
+                    2,
+                    self.filename,
+                    mock_get.side_effect,
                 ),
             ],
             any_order=False,
         )
         mock_error.assert_called_once_with(
-            f"Failed to download '{self.filename}' after {retries} attempts: Error Not Found"
+            "Failed to download '%s' after %s attempts: %s",
+            self.filename,
+            retries,
+            mock_get.side_effect,
         )
         mock_warning.assert_called_once_with(
-            f"No file to remove at {self.dest_dir}/{self.filename}"
+            "No file to remove at %s", f"{self.dest_dir}/{self.filename}"
         )
 
+    @patch("logging.Logger.error")
+    @patch("builtins.open", new_callable=unittest.mock.mock_open)
+    @patch("os.makedirs")
+    @patch("requests.get")
+    def test_checksum_mismatch_is_retried(
+        self, mock_get, mock_makedirs, mock_open, mock_error
+    ):
+        retries = 2
+        mock_response = MagicMock()
+        mock_response.headers = {}
+        mock_response.iter_content = MagicMock(return_value=[b"data"])
+        mock_get.return_value = mock_response
+
+        with self.assertRaises(ChecksumMismatchError):
+            self.handler.download_file(
+                self.uri, self.dest_dir, retries, "sha256:" + "0" * 64
+            )
+
+        self.assertEqual(mock_get.call_count, retries)
+        mock_error.assert_called_once_with(
+            "Failed to download '%s' after %s attempts: %s",
+            self.filename,
+            retries,
+            ANY,
+        )
+
+    @patch("requests.get")
+    def test_read_range_requests_byte_range(self, mock_get):
+        mock_response = mock_get.return_value.__enter__.return_value
+        mock_response.status_code = 206
+        mock_response.iter_content = MagicMock(return_value=[b"0123", b"4567"])
+        received = []
+
+        self.handler.read_range(self.uri, 10, 16, received.append)
+
+        _, kwargs = mock_get.call_args
+        self.assertEqual(kwargs["headers"]["Range"], "bytes=10-15")
+        self.assertEqual(received, [b"0123", b"45"])
+
+    @patch("requests.get")
+    def test_read_range_rejects_server_without_range_support(self, mock_get):
+        mock_response = mock_get.return_value.__enter__.return_value
+        mock_response.status_code = 200
+
+        with self.assertRaises(requests.RequestException):
+            self.handler.read_range(self.uri, 10, 16, lambda data: None)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,64 @@
+import hashlib
+import unittest
+from downloader.integrity import (
+    ChecksumMismatchError,
+    check_hasher,
+    checksum_from_headers,
+    checksum_from_sidecar,
+    new_hasher,
+)
+
+
+class TestIntegrity(unittest.TestCase):
+    def setUp(self):
+        self.data = b"data"
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+
+    def test_check_hasher_returns_digest(self):
+        hasher = new_hasher(f"sha256:{self.sha256}")
+        hasher.update(self.data)
+
+        digest = check_hasher(hasher, self.sha256, "dummyFile.pdf")
+
+        self.assertEqual(digest, f"sha256:{self.sha256}")
+
+    def test_check_hasher_mismatch(self):
+        hasher = new_hasher("md5:" + "0" * 32)
+        hasher.update(self.data)
+
+        with self.assertRaises(ChecksumMismatchError):
+            check_hasher(hasher, "md5:" + "0" * 32, "dummyFile.pdf")
+
+    def test_checksum_from_headers(self):
+        headers = {
+            "Digest": "md5=jXd/OF09/siBXSD3SWAm3A==, sha-256=Om6weQ85rIfJTzhWst0sXREOaBFgImGpqSPTuyOtyLc="
+        }
+
+        self.assertEqual(checksum_from_headers(headers), f"sha256:{self.sha256}")
+
+    def test_checksum_from_headers_ignores_encoded_body(self):
+        headers = {
+            "Content-Encoding": "gzip",
+            "Digest": "sha-256=Om6weQ85rIfJTzhWst0sXREOaBFgImGpqSPTuyOtyLc=",
+        }
+
+        self.assertIsNone(checksum_from_headers(headers))
+
+    def test_checksum_from_sidecar_picks_named_file(self):
+        other = "f" * 64
+        text = f"{other}  other.pdf\n{self.sha256}  dummyFile.pdf\n"
+
+        self.assertEqual(
+            checksum_from_sidecar(text, "dummyFile.pdf"), f"sha256:{self.sha256}"
+        )
+
+    def test_checksum_from_sidecar_bsd_style(self):
+        text = f"SHA256 (dummyFile.pdf) = {self.sha256.upper()}\n"
+
+        self.assertEqual(
+            checksum_from_sidecar(text, "dummyFile.pdf"), f"sha256:{self.sha256}"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+import logging
+import unittest
+from unittest.mock import patch
+from downloader.log_utils import (
+    DeferredQueueHandler,
+    JsonLinesFormatter,
+    RateLimitFilter,
+)
+
+
+def make_record(msg, *args, level=logging.DEBUG):
+    return logging.LogRecord("test_logger", level, __file__, 1, msg, args, None)
+
+
+class TestRateLimitFilter(unittest.TestCase):
+    @patch("time.monotonic")
+    def test_repeated_messages_are_suppressed_then_reported(self, mock_monotonic):
+        mock_monotonic.return_value = 0.0
+        rate_filter = RateLimitFilter(rate=2, period=1.0)
+
+        results = [
+            rate_filter.filter(make_record("Attempt %s failed", 1)) for _ in range(5)
+        ]
+        self.assertEqual(results, [True, True, False, False, False])
+
+        mock_monotonic.return_value = 1.5
+        record = make_record("Attempt %s failed", 1)
+
+        self.assertTrue(rate_filter.filter(record))
+        self.assertEqual(
+            record.getMessage(), "Attempt 1 failed (3 identical messages suppressed)"
+        )
+
+    @patch("time.monotonic", return_value=0.0)
+    def test_same_template_with_different_arguments_is_not_suppressed(
+        self, mock_monotonic
+    ):
+        rate_filter = RateLimitFilter(rate=1, period=1.0)
+
+        results = [
+            rate_filter.filter(make_record("Error downloading file %s", f"{n}.pdf"))
+            for n in range(5)
+        ]
+
+        self.assertEqual(results, [True, True, True, True, True])
+
+    @patch("time.monotonic", return_value=0.0)
+    def test_distinct_exceptions_with_the_same_text_are_repeats(self, mock_monotonic):
+        rate_filter = RateLimitFilter(rate=10, period=1.0)
+
+        results = [
+            rate_filter.filter(
+                make_record(
+                    "(Attempt %s of %s) - Error downloading file %s: %s",
+                    1,
+                    3,
+                    "dummyFile.pdf",
+                    ConnectionError("reset"),
+                )
+            )
+            for _ in range(100)
+        ]
+
+        self.assertEqual(results.count(True), 10)
+
+    @patch("time.monotonic", return_value=0.0)
+    def test_other_arguments_are_compared_by_their_text(self, mock_monotonic):
+        rate_filter = RateLimitFilter(rate=1, period=1.0)
+
+        results = [
+            rate_filter.filter(make_record("Headers %s", ["a"])),
+            rate_filter.filter(make_record("Headers %s", ["a"])),
+            rate_filter.filter(make_record("Headers %s", ["b"])),
+            rate_filter.filter(make_record("Headers %(name)s", {"name": "a"})),
+            rate_filter.filter(make_record("Headers %(name)s", {"name": "a"})),
+        ]
+
+        self.assertEqual(results, [True, False, True, True, False])
+
+    def test_records_above_level_are_never_suppressed(self):
+        rate_filter = RateLimitFilter(rate=1, level=logging.DEBUG)
+
+        results = [
+            rate_filter.filter(make_record("Failed %s", n, level=logging.ERROR))
+            for n in range(3)
+        ]
+
+        self.assertEqual(results, [True, True, True])
+
+
+class TestJsonLinesFormatter(unittest.TestCase):
+    def test_format_writes_one_json_object(self):
+        record = make_record("Downloaded %s", "dummyFile.pdf", level=logging.INFO)
+
+        entry = json.loads(JsonLinesFormatter().format(record))
+
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["logger"], "test_logger")
+        self.assertEqual(entry["message"], "Downloaded dummyFile.pdf")
+
+
+class TestDeferredQueueHandler(unittest.TestCase):
+    def test_prepare_leaves_formatting_to_the_listener(self):
+        record = make_record("Downloaded %s", "dummyFile.pdf")
+
+        prepared = DeferredQueueHandler(None).prepare(record)
+
+        self.assertIs(prepared, record)
+        self.assertEqual(prepared.args, ("dummyFile.pdf",))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from downloader.helper import DownloadManifest
+from downloader.mirror_downloader import MirrorDownloader
+from downloader.protocols.base_handler import BaseHandler
+
+
+class FakeHandler(BaseHandler):
+    def __init__(self, data, manifest, fail_after=None):
+        super().__init__(__class__.__name__, threading.Event(), manifest=manifest)
+        self.data = data
+        self.fail_after = fail_after
+        self.ranges = []
+
+    def get_file_size(self, uri):
+        return len(self.data)
+
+    def read_range(self, uri, start, end, callback):
+        self.ranges.append((start, end))
+        chunk = self.data[start:end]
+
+        if self.fail_after is not None:
+            callback(chunk[: self.fail_after])
+            raise OSError("Mirror stalled")
+
+        callback(chunk)
+
+
+class TestMirrorDownloader(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(1000)
+        self.dest_dir = tempfile.mkdtemp()
+        self.manifest = DownloadManifest(
+            os.path.join(self.dest_dir, "downloaded_files.json")
+        )
+        self.stop_event = threading.Event()
+
+    def tearDown(self):
+        shutil.rmtree(self.dest_dir)
+
+    def _downloader(self, handlers, **kwargs):
+        return MirrorDownloader(handlers, self.stop_event, probe_size=10, **kwargs)
+
+    def test_sequential_download_fails_over_mid_transfer(self):
+        stalling = FakeHandler(self.data, self.manifest, fail_after=300)
+        healthy = FakeHandler(self.data, self.manifest)
+        downloader = self._downloader({"http": stalling, "ftp": healthy})
+
+        with patch.object(
+            downloader, "_rank_sources", side_effect=lambda sources, size: sources
+        ):
+            result = downloader.download_file(
+                ["http://a/file.bin", "ftp://b/file.bin"], self.dest_dir, 1
+            )
+
+        self.assertEqual(result, os.path.join(self.dest_dir, "file.bin"))
+        with open(result, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        # The second mirror resumes where the first one stalled instead of starting over
+        self.assertEqual(healthy.ranges, [(300, 1000)])
+
+    def test_segmented_download_spreads_ranges_across_mirrors(self):
+        handlers = {
+            "http": FakeHandler(self.data, self.manifest),
+            "ftp": FakeHandler(self.data, self.manifest),
+        }
+        downloader = self._downloader(handlers, segment_size=100, segment_threshold=0)
+        checksum = f"sha256:{hashlib.sha256(self.data).hexdigest()}"
+
+        result = downloader.download_file(
+            ["http://a/file.bin", "ftp://b/file.bin"], self.dest_dir, 2, checksum
+        )
+
+        with open(result, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        fetched = sorted(
+            segment
+            for handler in handlers.values()
+            for segment in handler.ranges
+            if segment != (0, 10)
+        )
+        self.assertEqual(
+            fetched, [(start, start + 100) for start in range(0, 1000, 100)]
+        )
+        entry = self.manifest.get(f"http://a/file.bin|{self.dest_dir}")
+        self.assertEqual(entry["path"], result)
+        self.assertEqual(entry["digest"], checksum)
+
+    def test_stop_during_segmented_download_returns(self):
+        data = self.data[:200]
+        slow_started = threading.Event()
+
+        class StoppingHandler(FakeHandler):
+            def read_range(handler, uri, start, end, callback):
+                slow_started.set()
+                # Give the other mirror time to finish its segment and wait for this one
+                time.sleep(0.2)
+                self.stop_event.set()
+                raise KeyboardInterrupt("Download interrupted.")
+
+        class FastHandler(FakeHandler):
+            def read_range(handler, uri, start, end, callback):
+                slow_started.wait(1)
+                super().read_range(uri, start, end, callback)
+
+        handlers = {
+            "http": StoppingHandler(data, self.manifest),
+            "ftp": FastHandler(data, self.manifest),
+        }
+        downloader = self._downloader(handlers, segment_size=100, segment_threshold=0)
+        results = []
+
+        def download():
+            with patch.object(
+                downloader, "_rank_sources", side_effect=lambda sources, size: sources
+            ):
+                results.append(
+                    downloader.download_file(
+                        ["http://a/file.bin", "ftp://b/file.bin"], self.dest_dir, 2
+                    )
+                )
+
+        thread = threading.Thread(target=download, daemon=True)
+        thread.start()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(results, [None])
+        self.assertFalse(os.path.exists(os.path.join(self.dest_dir, "file.bin")))
+
+    def test_known_sizes_are_not_probed_again(self):
+        handlers = {
+            "http": FakeHandler(self.data, self.manifest),
+            "ftp": FakeHandler(self.data[:500], self.manifest),
+        }
+        downloader = self._downloader(handlers)
+        uris = ["http://a/file.bin", "ftp://b/file.bin"]
+
+        with patch.object(FakeHandler, "get_file_size") as mock_get_file_size:
+            result = downloader.download_file(
+                uris, self.dest_dir, 1, sizes={uris[0]: 1000, uris[1]: 500}
+            )
+
+        mock_get_file_size.assert_not_called()
+        self.assertIsNotNone(result)
+        self.assertEqual(handlers["ftp"].ranges, [])
+
+    def test_mirror_with_different_size_is_skipped(self):
+        handlers = {
+            "http": FakeHandler(self.data, self.manifest),
+            "ftp": FakeHandler(self.data[:500], self.manifest),
+        }
+        downloader = self._downloader(handlers)
+
+        with patch("logging.Logger.warning") as mock_warning:
+            result = downloader.download_file(
+                ["http://a/file.bin", "ftp://b/file.bin"], self.dest_dir, 1
+            )
+
+        self.assertIsNotNone(result)
+        self.assertEqual(handlers["ftp"].ranges, [])
+        mock_warning.assert_called_once_with(
+            "Skipping mirror %s: reported size %s, expected %s",
+            "ftp://b/file.bin",
+            500,
+            1000,
+        )
+
+    def test_checksum_mismatch_removes_file(self):
+        handler = FakeHandler(self.data, self.manifest)
+        downloader = self._downloader({"http": handler})
+
+        result = downloader.download_file(
+            ["http://a/file.bin"], self.dest_dir, 1, "sha256:" + "0" * 64
+        )
+
+        self.assertIsNone(result)
+        self.assertFalse(os.path.exists(os.path.join(self.dest_dir, "file.bin")))
+        self.assertEqual(self.manifest.entries, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from downloader.planner import DownloadPlan, DownloadPlanner, format_size
+
+
+class TestDownloadPlanner(unittest.TestCase):
+    def setUp(self):
+        self.sizes = {
+            "http://example.com/small.pdf": 10,
+            "ftp://hostname/huge.iso": 1000,
+            "sftp://hostname/medium.zip": 300,
+        }
+        self.handler = MagicMock()
+        self.handler.get_file_size.side_effect = lambda uri: self.sizes[uri]
+        self.planner = DownloadPlanner(
+            {"http": self.handler, "ftp": self.handler, "sftp": self.handler}
+        )
+
+    @patch("shutil.disk_usage")
+    def test_plan_orders_largest_first(self, mock_disk_usage):
+        mock_disk_usage.return_value.free = 5000
+
+        plan = self.planner.plan(list(self.sizes), "/fake/dir", 2)
+
+        self.assertEqual(
+            plan.uris,
+            [
+                "ftp://hostname/huge.iso",
+                "sftp://hostname/medium.zip",
+                "http://example.com/small.pdf",
+            ],
+        )
+        self.assertEqual(plan.total_bytes, 1310)
+        self.assertEqual(plan.makespan_bytes, 1000)
+        self.assertTrue(plan.fits)
+
+    @patch("shutil.disk_usage")
+    def test_unknown_sizes_are_started_first(self, mock_disk_usage):
+        mock_disk_usage.return_value.free = 5000
+        self.sizes["ftp://hostname/huge.iso"] = None
+
+        plan = self.planner.plan(list(self.sizes), "/fake/dir", 2)
+
+        self.assertEqual(plan.uris[0], "ftp://hostname/huge.iso")
+        self.assertEqual(plan.unknown_count, 1)
+        self.assertEqual(plan.total_bytes, 310)
+
+    @patch("shutil.disk_usage")
+    def test_mirror_group_falls_back_to_next_mirror(self, mock_disk_usage):
+        mock_disk_usage.return_value.free = 5000
+        self.sizes["ftp://hostname/medium.zip"] = OSError("Timed out")
+        self.handler.get_file_size.side_effect = self._size_or_raise
+        mirrors = ["ftp://hostname/medium.zip", "sftp://hostname/medium.zip"]
+
+        plan = self.planner.plan([mirrors], "/fake/dir", 1)
+
+        self.assertEqual(plan.entries, [(mirrors, 300)])
+        self.assertEqual(
+            plan.sizes,
+            {"ftp://hostname/medium.zip": None, "sftp://hostname/medium.zip": 300},
+        )
+
+    @patch("shutil.disk_usage")
+    def test_every_uri_is_probed_once(self, mock_disk_usage):
+        mock_disk_usage.return_value.free = 5000
+        mirrors = ["ftp://hostname/huge.iso", "http://example.com/small.pdf"]
+
+        plan = self.planner.plan(["ftp://hostname/huge.iso", mirrors], "/fake/dir", 1)
+
+        self.assertEqual(self.handler.get_file_size.call_count, 2)
+        self.assertEqual(plan.sizes, {uri: self.sizes[uri] for uri in mirrors})
+        # The mirrors disagree, so the group takes the first size seen most often
+        self.assertEqual(plan.entries[1], (mirrors, 1000))
+
+    def _size_or_raise(self, uri):
+        if isinstance(self.sizes[uri], Exception):
+            raise self.sizes[uri]
+        return self.sizes[uri]
+
+    def test_plan_does_not_fit_in_free_space(self):
+        plan = DownloadPlan([("ftp://hostname/huge.iso", 1000)], "/fake/dir", 1, 999)
+
+        self.assertFalse(plan.fits)
+        self.assertIn("Not enough free space", plan.describe())
+
+    def test_format_size(self):
+        self.assertEqual(format_size(None), "unknown")
+        self.assertEqual(format_size(512), "512 B")
+        self.assertEqual(format_size(1536), "1.5 KiB")
+        self.assertEqual(format_size(50 * 1024**3), "50.0 GiB")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,7 @@ import unittest
 import threading
 import unittest.mock
 import paramiko
-from unittest.mock import call, patch
+from unittest.mock import ANY, call, patch
 from downloader.protocols.sftp_handler import SFTPHandler
 
 
@@ -22,73 +22,121 @@ class TestSFTPHandler(unittest.TestCase):
         self.handler = SFTPHandler(self.stop_event, use_key=False)
 
     @patch("logging.Logger.info")
-    @patch("paramiko.SSHClient")
-    @patch("downloader.protocols.sftp_handler.SFTPHandler._ensure_directory")
-    def test_successful_download(self, mock_ensure_dir, mock_ssh_client, mock_info):
+    @patch("builtins.open", new_callable=unittest.mock.mock_open)
+    @patch("paramiko.SFTPClient.from_transport")
+    @patch("paramiko.Transport")
+    @patch("socket.create_connection")
+    @patch("downloader.protocols.sftp_handler.SFTPHandler.ensure_directory")
+    def test_successful_download(
+        self,
+        mock_ensure_dir,
+        mock_create_connection,
+        mock_transport_class,
+        mock_from_transport,
+        mock_open,
+        mock_info,
+    ):
         mock_ensure_dir.return_value = True
         # Mock entering the with statment to start the SFTP context
-        mock_ssh = mock_ssh_client.return_value.__enter__.return_value
-        mock_sftp = mock_ssh.open_sftp.return_value.__enter__.return_value
-        mock_sftp.get.return_value = None
+        mock_transport = mock_transport_class.return_value.__enter__.return_value
+        mock_sftp = mock_from_transport.return_value.__enter__.return_value
+        mock_sftp.stat.return_value.st_size = 4
+        mock_file = mock_sftp.open.return_value.__enter__.return_value
+        mock_file.read.side_effect = [b"data", b""]
 
         self.handler.download_file(self.uri, self.dest_dir, 1)
 
-        mock_ssh.connect.assert_called_once_with(
-            self.hostname,
-            self.port,
-            self.username,
-            self.password,
-            look_for_keys=False,
-            allow_agent=False,
+        mock_create_connection.assert_called_once_with(
+            (self.hostname, self.port), timeout=self.handler.timeout
+        )
+        mock_transport.start_client.assert_called_once()
+        mock_transport.auth_password.assert_called_once_with(
+            self.username, self.password
         )
 
-        actual_args, _ = mock_sftp.get.call_args
-        self.assertEqual(actual_args[0], self.remote_path)
-        self.assertEqual(actual_args[1], self.local_filepath)
-        self.assertTrue(callable(actual_args[2]))
+        mock_sftp.open.assert_called_once_with(self.remote_path, "rb")
+        mock_file.prefetch.assert_called_once_with(4, ANY)
+        mock_open.assert_any_call(self.local_filepath, "wb")
+        mock_open().write.assert_any_call(b"data")
         mock_info.assert_called_once_with(
-            f"Successfully downloaded '{self.filename}' to '{self.dest_dir}'"
+            "Successfully downloaded '%s' to '%s'", self.filename, self.dest_dir
         )
 
     @patch("logging.Logger.debug")
     @patch("logging.Logger.warning")
     @patch("logging.Logger.error")
-    @patch("paramiko.SSHClient")
-    @patch("downloader.protocols.sftp_handler.SFTPHandler._ensure_directory")
+    @patch("paramiko.Transport")
+    @patch("socket.create_connection")
+    @patch("downloader.protocols.sftp_handler.SFTPHandler.ensure_directory")
     def test_download_failure_and_retries(
-        self, mock_ensure_dir, mock_ssh_client, mock_error, mock_warning, mock_debug
+        self,
+        mock_ensure_dir,
+        mock_create_connection,
+        mock_transport_class,
+        mock_error,
+        mock_warning,
+        mock_debug,
     ):
         retries = 2
 
         mock_ensure_dir.return_value = True
-        mock_ssh = mock_ssh_client.return_value.__enter__.return_value
-        mock_ssh.connect.side_effect = paramiko.SSHException("Connection failed")
-        mock_ssh.open_sftp.return_value.__enter__.return_value.get.side_effect = (
-            paramiko.SSHException("Transfer failed")
+        mock_transport = mock_transport_class.return_value.__enter__.return_value
+        mock_transport.start_client.side_effect = paramiko.SSHException(
+            "Connection failed"
         )
 
         with self.assertRaises(paramiko.SSHException):
             self.handler.download_file(self.uri, self.dest_dir, retries)
 
-        self.assertEqual(mock_ssh.connect.call_count, retries)
+        self.assertEqual(mock_transport.start_client.call_count, retries)
         mock_debug.assert_has_calls(
             [
                 call(
-                    f"(Attempt 1 of 2) - Error downloading file {self.filename}: Connection failed"
+                    "(Attempt %s of %s) - Error downloading file %s: %s",
+                    1,
+                    2,
+                    self.filename,
+                    mock_transport.start_client.side_effect,
                 ),
                 call(
-                    f"(Attempt 2 of 2) - Error downloading file {self.filename}: Connection failed"
+                    "(Attempt %s of %s) - Error downloading file %s: %s",
+                    2,
+                    2,
+                    self.filename,
+                    mock_transport.start_client.side_effect,
                 ),
             ],
             any_order=False,
         )
         mock_error.assert_called_once_with(
-            f"Failed to download '{self.filename}' after {retries} attempts: Connection failed"
+            "Failed to download '%s' after %s attempts: %s",
+            self.filename,
+            retries,
+            mock_transport.start_client.side_effect,
         )
         mock_warning.assert_called_once_with(
-            f"No file to remove at {self.dest_dir}/{self.filename}"
+            "No file to remove at %s", f"{self.dest_dir}/{self.filename}"
         )
 
+    @patch("paramiko.SFTPClient.from_transport")
+    @patch("paramiko.Transport")
+    @patch("socket.create_connection")
+    def test_read_range_reads_chunks_at_offsets(
+        self, mock_create_connection, mock_transport_class, mock_from_transport
+    ):
+        self.handler.chunk_size = 4
+        mock_sftp = mock_from_transport.return_value.__enter__.return_value
+        mock_file = mock_sftp.open.return_value.__enter__.return_value
+        mock_file.readv.return_value = iter([b"0123", b"4567", b"89"])
+        received = []
+
+        self.handler.read_range(self.uri, 100, 110, received.append)
+
+        mock_sftp.open.assert_called_once_with(self.remote_path, "rb")
+        chunks, _ = mock_file.readv.call_args.args
+        self.assertEqual(chunks, [(100, 4), (104, 4), (108, 2)])
+        self.assertEqual(received, [b"0123", b"4567", b"89"])
+
 
 if __name__ == "__main__":
     unittest.main()